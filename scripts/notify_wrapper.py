@@ -1,5 +1,4 @@
 #!/usr/bin/python3
-import sys
 import argparse
 import asyncio
 
@@ -39,11 +38,17 @@ async def main():
     interval = DRYER_INTERVAL if args.dryer else WASHER_INTERVAL
     print(f"args.dryer: {args.dryer}, interval: {interval}")
 
-    # First run strip_control.py
-    await run_script("strip_control.py", STRIP_NAME, "on", "-b", "1", "-i", interval)
-
-    # Then run plug_control.py
-    await run_script("plug_control.py", PLUG_NAME, "on", "-b", "1", "-i", interval)
+    # Run both controls concurrently, they drive independent devices
+    await asyncio.gather(
+        run_script("strip_control.py", STRIP_NAME, "on", "-b", "1", "-i", interval),
+        run_script("plug_control.py", PLUG_NAME, "on", "-b", "1", "-i", interval),
+    )
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(main())
@@ -1,44 +1,70 @@
 #!/usr/bin/python3
 
 import asyncio
-from kasa import Discover, SmartDevice
-import smtplib
-from email.message import EmailMessage
-from datetime import datetime, timedelta, time
+from kasa import Discover, KasaException, Module, SmartDevice
+from datetime import datetime, time
 import logging
 import argparse
-from typing import Set, Union, ForwardRef, Dict, List, Optional
-from os.path import isfile
+from typing import Optional
 from enum import Enum
-import configparser
-import traceback
-from math import ceil
-from dataclasses import dataclass
+import json
+import os
+import random
+from dataclasses import dataclass, field
+from collections import deque
+from statistics import median
 import atexit
+import contextlib
+import copy
 import signal
-import sys
-import inspect
+from time import monotonic
 import requests
-from logging.handlers import TimedRotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from hilo_software_utilities.send_mail import send_text_email
 from hilo_software_utilities.custom_logger import init_logging
 
 APP_TAG = "washer dryer notifier"
 LOG_FILE = "washer_dryer_notifier.log"
 CONFIG_FILE = "washer_dryer_notifier.config"
-SETUP_PROBE_INTERVAL_SECS = 30
+CYCLE_HISTORY_FILE = "washer_dryer_notifier.history"
+SETUP_PROBE_INTERVAL_SECS = 2
 RUNNING_TIME_WAIT_SECS = 60
 RUNNING_SETUP_RETRY_MAX = 5
-PROBE_INTERVAL_SECS = 5 * 60
+RUNNING_PROBE_INTERVAL_SECS = 15
+RUNNING_PROBE_INTERVAL_MAX_SECS = 5 * 60
+CYCLE_HISTORY_MAX = 20
+CYCLE_HISTORY_MIN = 3
+IDLE_PROBE_INTERVAL_SECS = 60
+IDLE_PROBE_INTERVAL_MAX_SECS = 10 * 60
 PLUG_SETTLE_TIME_SECS = 10
-RETRY_MAX = 3
-RETRY_SLEEP_DELAY = 30
+RETRY_BACKOFF_BASE_SECS = 5
+RETRY_BACKOFF_MAX_SECS = 5 * 60
+RETRY_JITTER_SECS = 5
+REDISCOVER_RETRY_COUNT = 2
 IDLE_TAG = 'idle'
 RUNNING_TAG = 'running'
+IP_TAG = 'ip'
 PUSHBULLET_CHANNEL_TAG = "washer_dryer_notifier"
+PUSHBULLET_PUSHES_URL = "https://api.pushbullet.com/v2/pushes"
+PUSHBULLET_TIMEOUT_SECS = 10
+PUSHBULLET_BATCH_MAX = 10
 INIT_TIMEOUT = 30
 UPDATE_TIMEOUT = 10
+UPDATE_FRESH_SECS = 1.0
+FULL_UPDATE_EVERY_READS = 20
+SLOW_READ_SECS = 2.0
 TURN_ON_TIMEOUT = 10
+DISCOVER_CACHE_TTL_SECS = 60
+NOTIFIER_DRAIN_TIMEOUT_SECS = 10
+NOTIFIER_CONCURRENCY_MAX = 2
+NOTIFY_MIN_INTERVAL_SECS = 15 * 60
+INIT_CONCURRENCY_MAX = 8
+POWER_WINDOW_SIZE = 3
+IDLE_TOLERANCE_WATTS = 0.5
+IDLE_RATIO = 1.5
+# Log args of these types are safe to format later on the QueueListener thread
+IMMUTABLE_LOG_ARG_TYPES = (str, int, float, bool, bytes, type(None), Enum)
 
 
 class RunMode(Enum):
@@ -65,20 +91,29 @@ class PushbulletBroadcaster:
             "Access-Token": self.access_token,
             "Content-Type": "application/json"
         }
+        # Keep-alive session so repeat notifications skip the TCP/TLS handshake
+        self.session = requests.Session()
+        atexit.register(self.session.close)
+        self.pending: list[tuple[str, str]] = []
 
     
-    def post_bullet(payload, headers: dict[str, str]) -> requests.Response:
+    @staticmethod
+    def post_bullet(payload, headers: dict[str, str], session: Optional[requests.Session] = None) -> requests.Response:
         '''
         Wrapper for the request.post function
 
         Args:
             payload (_type_): http post payload
             headers (dict[str, str]): http header specific to Pushbullet with API key and channel_tag
+            session (Optional[requests.Session]): session to reuse, a one-off connection if None
 
         Returns:
             requests.Response: http response
         '''
-        return requests.post("https://api.pushbullet.com/v2/pushes", json=payload, headers=headers)
+        # headers already declare application/json, so hand requests the encoded body directly
+        data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode()
+        return (session or requests).post(PUSHBULLET_PUSHES_URL, data=data, headers=headers,
+                                          timeout=PUSHBULLET_TIMEOUT_SECS)
     
 
     def send_notification(self, title: str, message: str):
@@ -89,29 +124,59 @@ class PushbulletBroadcaster:
             "channel_tag": self.channel_tag
         }
 
-        response = PushbulletBroadcaster.post_bullet(payload, self.headers)
+        response = PushbulletBroadcaster.post_bullet(payload, self.headers, self.session)
 
         if response.status_code == 200:
             logger.custom("✅ Notification sent successfully!")
         else:
-            logger.error(f"❌ Failed to send notification: {response.status_code} - {response.json()}")
+            logger.error("❌ Failed to send notification: %s - %s", response.status_code, response.text)
 
 
+    def queue_notification(self, title: str, message: str) -> None:
+        self.pending.append((title, message))
 
-@dataclass
+
+    def flush(self) -> None:
+        '''
+        Sends the queued notifications, coalescing up to PUSHBULLET_BATCH_MAX of them
+        into a single push since Pushbullet has no batch endpoint.  If a push fails,
+        every unsent notification is logged and dropped before the exception is
+        re-raised, rather than going out hours later with an unrelated one.
+        '''
+        while self.pending:
+            batch = self.pending[:PUSHBULLET_BATCH_MAX]
+            try:
+                if len(batch) == 1:
+                    self.send_notification(*batch[0])
+                else:
+                    self.send_notification(APP_TAG, "\n".join(f"{title}{message}" for title, message in batch))
+            except Exception:
+                logger.error("flush: dropping %d unsent notification(s): %s", len(self.pending),
+                             [f"{title}{message}" for title, message in self.pending])
+                self.pending.clear()
+                raise
+            del self.pending[:len(batch)]
+
+
+
+@dataclass(slots=True)
 class AppliancePlugInfo():
     appliance_type: ApplianceType
     appliance_plug_name: str
+    ip: Optional[str] = None
 
 
     def __repr__(self):
-        return f"AppliancePlugInfo(type={self.appliance_type}, name='{self.appliance_plug_name}')"
+        return f"AppliancePlugInfo(type={self.appliance_type}, name='{self.appliance_plug_name}', ip={self.ip})"
 
 
-@dataclass
+@dataclass(slots=True)
 class AppliancePlug():
     appliance_plug_info: AppliancePlugInfo
     appliance_plug: SmartDevice
+    last_update: float = 0.0
+    emeter_reads: int = 0
+    last_read_secs: float = 0.0
 
 
     def __repr__(self):
@@ -125,16 +190,44 @@ class EmailContext():
     app_key: str
 
 
-class Appliance():
-    appliance_plug: AppliancePlug = None
-    appliance_mode: ApplianceMode = ApplianceMode.IDLE
-    appliance_idle_power: float = 0
-    appliance_running_power: float = 0
+def next_appliance_mode(mode: ApplianceMode, power: float, running_threshold: float,
+                        finished_threshold: float) -> ApplianceMode:
+    '''
+    Pure state machine transition, free of I/O and Appliance state.
 
-    def __init__(self, plug: AppliancePlug):
-        self.appliance_plug = plug
-        self.appliance_mode = ApplianceMode.IDLE
+    Args:
+        mode (ApplianceMode): current mode
+        power (float): smoothed power reading
+        running_threshold (float): power above which the appliance is running
+        finished_threshold (float): power at or below which a running appliance has finished
 
+    Returns:
+        ApplianceMode: next mode
+    '''
+    if mode is ApplianceMode.IDLE and power > running_threshold:
+        return ApplianceMode.RUNNING
+    if mode is ApplianceMode.RUNNING and power <= finished_threshold:
+        return ApplianceMode.FINISHED
+    return mode
+
+
+@dataclass(slots=True, eq=False)
+class Appliance():
+    appliance_plug: AppliancePlug
+    appliance_name: str = field(init=False)
+    appliance_mode: ApplianceMode = ApplianceMode.IDLE
+    appliance_idle_power: float = 0.0
+    appliance_running_power: float = 0.0
+    running_threshold: float = field(default=0.0, init=False)
+    finished_threshold: float = field(default=0.0, init=False)
+    power_window: deque[float] = field(default_factory=lambda: deque(maxlen=POWER_WINDOW_SIZE), init=False)
+    running_since: Optional[float] = field(default=None, init=False)
+    last_notified_at: Optional[float] = field(default=None, init=False)
+    cycle_durations: deque[float] = field(default_factory=lambda: deque(maxlen=CYCLE_HISTORY_MAX), init=False)
+
+    def __post_init__(self):
+        self.appliance_name = self.appliance_plug.appliance_plug_info.appliance_plug_name
+        self.set_appliance_idle_power(self.appliance_idle_power)
 
     def __repr__(self):
         return (f"Appliance(name='{self.get_appliance_name()}', "
@@ -145,7 +238,7 @@ class Appliance():
 
 
     def get_appliance_name(self) -> str:
-        return self.appliance_plug.appliance_plug_info.appliance_plug_name
+        return self.appliance_name
 
 
     def get_appliance_mode(self) -> ApplianceMode:
@@ -158,6 +251,11 @@ class Appliance():
     
     def set_appliance_idle_power(self, appliance_idle_power: float) -> None:
         self.appliance_idle_power = appliance_idle_power
+        # Running is anything above twice the idle draw, computed once here rather than per poll
+        self.running_threshold = 2 * appliance_idle_power
+        # Meter readings jitter, so finished is a band around idle rather than an exact match
+        self.finished_threshold = min(max(appliance_idle_power + IDLE_TOLERANCE_WATTS, IDLE_RATIO * appliance_idle_power),
+                                      self.running_threshold)
 
 
     def get_appliance_idle_power(self) -> float:
@@ -173,248 +271,804 @@ class Appliance():
 
     async def query(self) -> ApplianceMode:
         '''
-        State machine
+        State machine.  RUNNING is entered on the median of the last
+        POWER_WINDOW_SIZE samples so a single spike does not flip the mode.  FINISHED
+        needs every sample in the window at or below the finished threshold, so a
+        short low-power phase mid cycle (soak, pause) is not mistaken for the end.
 
         Returns:
             ApplianceMode: Resulting State
         '''
-        logger.info(f"{self.get_appliance_name()}: query: ENTRY mode: {self.appliance_mode}")
-        power = await self.get_power()
-        match self.appliance_mode:
-            case ApplianceMode.IDLE:
-                if power <= (2 * self.appliance_idle_power):
-                    pass
-                else:
-                    self.appliance_mode = ApplianceMode.RUNNING
-            case ApplianceMode.RUNNING:
-                if power == self.appliance_idle_power:
-                    self.appliance_mode = ApplianceMode.FINISHED
-        logger.info(f"{self.get_appliance_name()}: query: EXIT mode: {self.appliance_mode}")
+        self.power_window.append(await self.get_power())
+        previous_mode = self.appliance_mode
+        if previous_mode is ApplianceMode.RUNNING:
+            power = max(self.power_window)
+        else:
+            power = median(self.power_window)
+        self.appliance_mode = next_appliance_mode(previous_mode, power,
+                                                  self.running_threshold, self.finished_threshold)
+        if previous_mode is ApplianceMode.IDLE and self.appliance_mode is ApplianceMode.RUNNING:
+            self.running_since = monotonic()
+        logger.info("%s: query: mode: %s -> %s, power: %.2f", self.appliance_name, previous_mode, self.appliance_mode,
+                    self.power_window[-1])
         return self.appliance_mode
     
 
     async def get_power(self) -> float:
-        await asyncio.wait_for(self.appliance_plug.appliance_plug.update(), UPDATE_TIMEOUT)
-        return self.appliance_plug.appliance_plug.emeter_realtime.power
+        plug = self.appliance_plug
+        start = monotonic()
+        # Reuse a reading taken moments ago, e.g. by init_plugs right before the first query
+        if start - plug.last_update <= UPDATE_FRESH_SECS:
+            # No network read happened, so an earlier slow read must not keep stretching the interval
+            plug.last_read_secs = 0.0
+            return get_power(plug.appliance_plug)
+        energy = energy_module(plug.appliance_plug)
+        if energy is not None and plug.emeter_reads < FULL_UPDATE_EVERY_READS:
+            # Query only the energy meter instead of sysinfo plus every module
+            async with asyncio.timeout(UPDATE_TIMEOUT):
+                status = await energy.get_status()
+            plug.emeter_reads += 1
+            plug.last_read_secs = monotonic() - start
+            return status.power
+        # Periodic full update keeps sysinfo current, e.g. a relay someone switched off
+        async with asyncio.timeout(UPDATE_TIMEOUT):
+            await plug.appliance_plug.update()
+        plug.last_update = monotonic()
+        plug.last_read_secs = plug.last_update - start
+        plug.emeter_reads = 0
+        if not plug.appliance_plug.is_on:
+            logger.warning("%s: plug is switched off, power readings will stay at 0", self.appliance_name)
+        return get_power(plug.appliance_plug)
 
 
 class ApplianceException(Exception):
     def __init__(self, msg: str):
+        super().__init__(msg)
         self.msg = msg
 
 
-log_file = LOG_FILE
 logger = None
-washer: Appliance = None
-dryer: Appliance = None
-appliances: [] = []
-setup_mode: bool = False
-access_token: str = None
 pbb: PushbulletBroadcaster = None
-block_window: Optional[tuple] = None
+_discover_cache: dict[str, SmartDevice] = {}
+_discover_ts: float = 0.0
+# Devices connected directly by pinned ip, kept apart from the discovery cache so they don't mask a stale broadcast
+_pinned_devices: list[SmartDevice] = []
+_config_cache: dict[tuple[str, int, int], dict] = {}
+# Appliances main_loop is polling, SIGHUP re-reads their thresholds in place and close_plugs
+# closes the devices they hold, which a refresh may have taken out of the discovery cache
+_live_appliances: list[Appliance] = []
+# Reaper tasks for detached notifier scripts, holding a reference keeps them from being collected
+_notifier_tasks: set[asyncio.Task] = set()
+# (loop, semaphore) bounding notifier scripts, see notifier_semaphore
+_notifier_semaphore: Optional[tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        '''
+        QueueHandler.prepare formats the message in the emitting thread so the
+        record can be pickled.  The queue here never leaves the process, so a record
+        whose args are all immutable is passed through as is and the QueueListener
+        thread formats it.  Any other arg, e.g. an Appliance the event loop keeps
+        updating, is formatted here so the log shows its state at the time of the call.
+        '''
+        args = record.args.values() if isinstance(record.args, dict) else record.args
+        if args and not all(isinstance(arg, IMMUTABLE_LOG_ARG_TYPES) for arg in args):
+            record = copy.copy(record)
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
 
+def queue_logging_handlers(target_logger: logging.Logger) -> QueueListener:
+    '''
+    Moves the handlers installed by init_logging behind a DeferredQueueHandler so
+    that logging from the event loop is an in-memory enqueue and both formatting
+    and file I/O run on a QueueListener thread.
 
-def fn_name():
-    return inspect.currentframe().f_back.f_code.co_name
+    Args:
+        target_logger (logging.Logger): logger returned by init_logging
+
+    Returns:
+        QueueListener: started listener, stopped at exit
+    '''
+    handlers = target_logger.handlers[:]
+    for handler in handlers:
+        target_logger.removeHandler(handler)
+    log_queue = queue.SimpleQueue()
+    target_logger.addHandler(DeferredQueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def parse_block_time(value: str) -> time:
+    '''
+    argparse type for -b, so a malformed window is rejected at startup rather
+    than reparsed on every notification.
 
+    Args:
+        value (str): time in 24h HH:MM format
 
-def is_within_block(start: str, stop: str) -> bool:
-    """Return True if current time falls within [start, stop)."""
+    Returns:
+        time: parsed time of day
+    '''
     try:
+        return datetime.strptime(value, "%H:%M").time()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid HH:MM time: {value!r}")
+
+
+def is_within_block(start_t: time, stop_t: time, now: Optional[time] = None) -> bool:
+    """Return True if current time falls within [start_t, stop_t)."""
+    if now is None:
         now = datetime.now().time()
-        start_t = datetime.strptime(start, "%H:%M").time()
-        stop_t = datetime.strptime(stop, "%H:%M").time()
+    if start_t <= stop_t:
+        return start_t <= now < stop_t
+    # Handles overnight wrap (e.g. 22:00–06:00)
+    return now >= start_t or now < stop_t
 
-        if start_t <= stop_t:
-            return start_t <= now < stop_t
-        else:
-            # Handles overnight wrap (e.g. 22:00–06:00)
-            return now >= start_t or now < stop_t
+
+async def cached_discover(ttl: float = DISCOVER_CACHE_TTL_SECS, refresh: bool = False) -> dict[str, SmartDevice]:
+    '''
+    async function.  Runs kasa discovery at most once per ttl seconds and caches
+    the discovered devices keyed by alias.
+
+    Args:
+        ttl (float): seconds a discovery result stays valid
+        refresh (bool): discard the cached result and discover again
+
+    Returns:
+        dict[str, SmartDevice]: alias to device map
+    '''
+    global _discover_ts
+    if refresh or not _discover_cache or monotonic() - _discover_ts > ttl:
+        async with asyncio.timeout(INIT_TIMEOUT):
+            found = await Discover.discover()
+        _discover_cache.clear()
+        _discover_cache.update({smart_device.alias: smart_device for smart_device in found.values()})
+        _discover_ts = monotonic()
+    return _discover_cache
+
+
+async def drain_notifier_tasks(timeout: float = NOTIFIER_DRAIN_TIMEOUT_SECS) -> None:
+    '''
+    async function.  Gives detached notifier scripts up to timeout seconds to exit
+    before shutdown.
+    '''
+    if not _notifier_tasks:
+        return
+    _, pending = await asyncio.wait(set(_notifier_tasks), timeout=timeout)
+    if pending:
+        logger.warning("drain_notifier_tasks: %d notifier script(s) still running", len(pending))
+
+
+async def close_plugs() -> None:
+    '''
+    async function.  Closes the connections kasa keeps open to the cached and pinned
+    devices and to the devices the live appliances hold.  Each device handle is reused
+    for the life of the process, so this only runs at shutdown.
+    '''
+    live_devices = [appliance.appliance_plug.appliance_plug for appliance in _live_appliances]
+    smart_devices = {id(smart_device): smart_device
+                     for smart_device in [*_discover_cache.values(), *_pinned_devices, *live_devices]}
+    for smart_device in smart_devices.values():
+        await close_plug(smart_device)
+    _discover_cache.clear()
+    _pinned_devices.clear()
+    _live_appliances.clear()
+
+
+async def close_plug(smart_device: SmartDevice) -> None:
+    '''
+    async function.  Closes the connection kasa keeps open to one device.  A device
+    that is already gone must not hold up the caller, so failures are ignored.
+    '''
+    with contextlib.suppress(Exception):
+        # Newer kasa releases expose disconnect(), older ones only the protocol
+        close = getattr(smart_device, "disconnect", None) or smart_device.protocol.close
+        async with asyncio.timeout(UPDATE_TIMEOUT):
+            await close()
+
+
+async def connect_pinned_plug(target_plug_info: AppliancePlugInfo) -> Optional[SmartDevice]:
+    '''
+    async function.  Connects straight to a plug at the ip pinned by setup mode,
+    avoiding the LAN wide discovery broadcast.
+
+    Returns:
+        SmartDevice or None if the ip is unreachable or now belongs to another device
+    '''
+    try:
+        async with asyncio.timeout(INIT_TIMEOUT):
+            smart_device = await Discover.discover_single(target_plug_info.ip)
     except Exception as e:
-        logger.error(f"is_within_block parse error: {e}")
-        return False
+        logger.warning("connect_pinned_plug: %s at %s: %s", target_plug_info.appliance_plug_name, target_plug_info.ip, e)
+        return None
+    if smart_device.alias != target_plug_info.appliance_plug_name:
+        logger.warning("connect_pinned_plug: %s is now %s, not %s",
+                       target_plug_info.ip, smart_device.alias, target_plug_info.appliance_plug_name)
+        return None
+    _pinned_devices.append(smart_device)
+    return smart_device
+
+
+async def refresh_appliance_plugs(appliances: list[Appliance]) -> None:
+    '''
+    async function.  Rediscovers the LAN and points each appliance at the device now
+    answering to its alias, for plugs that moved to a new ip.  Devices whose host
+    is unchanged keep their existing connection.
+    '''
+    devices = await cached_discover(refresh=True)
+    moved: dict[str, str] = {}
+    for appliance in appliances:
+        smart_device = devices.get(appliance.get_appliance_name())
+        if smart_device is not None and smart_device.host != appliance.appliance_plug.appliance_plug.host:
+            logger.warning("%s: plug moved to %s", appliance.get_appliance_name(), smart_device.host)
+            # Release the stale handle, a dead plug lands here on every failed poll
+            stale_device = appliance.appliance_plug.appliance_plug
+            with contextlib.suppress(ValueError):
+                _pinned_devices.remove(stale_device)
+            await close_plug(stale_device)
+            appliance.appliance_plug.appliance_plug = smart_device
+            appliance.appliance_plug.appliance_plug_info.ip = smart_device.host
+            appliance.appliance_plug.last_update = 0.0
+            # The new device has never been updated, make its first read a full update()
+            appliance.appliance_plug.emeter_reads = FULL_UPDATE_EVERY_READS
+            moved[appliance.get_appliance_name()] = smart_device.host
+    if moved:
+        update_plug_ips(moved)
+
+
+async def bounded(semaphore: asyncio.Semaphore, awaitable, timeout: Optional[float] = None):
+    '''
+    async function.  Awaits awaitable while holding semaphore.  The optional timeout
+    starts once the semaphore is held, so time spent queued is not counted.
+    '''
+    async with semaphore:
+        async with asyncio.timeout(timeout):
+            return await awaitable
 
 
 async def init_plugs(target_plug_infos: list[AppliancePlugInfo]) -> list[AppliancePlug]:
     '''
     async function.  Uses kasa library to discover and find target device(s) matching target_plug(s) alias.
+    Targets with a pinned ip are connected to directly and discovery only runs if
+    any target is still unresolved.  Matched devices are updated and, if off, turned on
+    concurrently, then share a single PLUG_SETTLE_TIME_SECS wait.
 
     Returns:
         list of matching plugs
     '''
     matching_plugs: list[AppliancePlug] = []
     try:
-        found = await asyncio.wait_for(Discover.discover(), INIT_TIMEOUT)
-        for smart_device in found.values():
-            await asyncio.wait_for(smart_device.update(), UPDATE_TIMEOUT)
-            for target_plug_info in target_plug_infos:
-                if smart_device.alias == target_plug_info.appliance_plug_name:
-                    if not smart_device.is_on:
-                        if not await asyncio.wait_for(turn_on(smart_device), TURN_ON_TIMEOUT):
-                            logger.warning(f"WARNING: Unable to turn on plug: {target_plug_info.appliance_plug_name}")
-                            continue
-                        logger.info(f"plug: was off, now successfully turned on so we delay {PLUG_SETTLE_TIME_SECS} seconds to allow power to settle")
-                        await asyncio.sleep(PLUG_SETTLE_TIME_SECS)
-                        await asyncio.wait_for(smart_device.update(), UPDATE_TIMEOUT)
-                    matching_plugs.append(AppliancePlug(target_plug_info, smart_device))
+        pinned_lookups = [connect_pinned_plug(info) for info in target_plug_infos if info.ip]
+        if any(info.ip is None for info in target_plug_infos):
+            # Discovery is needed regardless, so overlap it with the pinned connects
+            discovered, *pinned = await asyncio.gather(cached_discover(), *pinned_lookups)
+        else:
+            discovered, pinned = {}, await asyncio.gather(*pinned_lookups)
+        devices = {**discovered, **{smart_device.alias: smart_device for smart_device in pinned if smart_device is not None}}
+        if any(info.appliance_plug_name not in devices for info in target_plug_infos):
+            devices = {**await cached_discover(), **devices}
+        semaphore = asyncio.Semaphore(INIT_CONCURRENCY_MAX)
+        targets = [(info, smart_device) for info in target_plug_infos
+                   if (smart_device := devices.get(info.appliance_plug_name)) is not None]
+        results = await asyncio.gather(*(bounded(semaphore, smart_device.update(), UPDATE_TIMEOUT)
+                                         for _, smart_device in targets),
+                                       return_exceptions=True)
+        for (info, _), result in zip(targets, results):
+            if isinstance(result, BaseException):
+                logger.error("init_plugs: %s Exception: %s", info.appliance_plug_name, result, exc_info=result)
+        targets = [target for target, result in zip(targets, results) if not isinstance(result, BaseException)]
+        updated_at = monotonic()
+
+        off_targets = [(info, smart_device) for info, smart_device in targets if not smart_device.is_on]
+        turned_on = await asyncio.gather(*(bounded(semaphore, turn_on(smart_device)) for _, smart_device in off_targets))
+        failed_names = set()
+        for (info, _), is_on in zip(off_targets, turned_on):
+            if not is_on:
+                logger.warning("WARNING: Unable to turn on plug: %s", info.appliance_plug_name)
+                failed_names.add(info.appliance_plug_name)
+        if any(turned_on):
+            logger.info("plug(s): were off, now successfully turned on so we delay %d seconds to allow power to settle",
+                        PLUG_SETTLE_TIME_SECS)
+            await asyncio.sleep(PLUG_SETTLE_TIME_SECS)
+        # Plugs that were just turned on have no reading since, leave them stale
+        matching_plugs = [AppliancePlug(info, smart_device, 0.0 if (info, smart_device) in off_targets else updated_at)
+                          for info, smart_device in targets
+                          if info.appliance_plug_name not in failed_names]
     except TimeoutError as te:
-        logger.error(f"init_plugs timed out: {te}")
-    except Exception as e:
-        logger.error(f"init_plugs Exception: {e}")
+        logger.error("init_plugs timed out: %s", te)
+    except Exception:
+        logger.exception("init_plugs Exception")
     return matching_plugs
 
 
 async def turn_on(plug: SmartDevice) -> bool:
+    '''
+    Turns the plug on.  kasa raises if the relay command fails, so no
+    follow-up update() is issued to confirm is_on.
+
+    Returns:
+        bool: True if the plug was turned on
+    '''
     try:
-        await asyncio.wait_for(plug.turn_on(), TURN_ON_TIMEOUT)
-        await asyncio.wait_for(plug.update(), UPDATE_TIMEOUT)
-        return plug.is_on
+        async with asyncio.timeout(TURN_ON_TIMEOUT):
+            await plug.turn_on()
+        return True
     except TimeoutError as te:
-        logger.error(f"turn_on timed out: {te}")
-    except Exception as e:
-        logger.error(f"turn_on Exception: {e}")
+        logger.error("turn_on timed out: %s", te)
+    except Exception:
+        logger.exception("turn_on Exception")
     return False
 
 
+def energy_module(plug: SmartDevice):
+    '''
+    Returns the kasa energy module of a plug, or None if the plug has no energy
+    meter or has not been updated yet.  kasa raises on modules until the first
+    update(), so a freshly discovered plug is reported as None here.
+    '''
+    try:
+        return plug.modules.get(Module.Energy)
+    except KasaException:
+        return None
+
+
 def get_power(plug: SmartDevice) -> float:
-    return plug.emeter_realtime.power
+    '''
+    Returns the power reported by the last update() of the plug.
+
+    Raises:
+        ApplianceException: plug has no energy meter or was never updated
+    '''
+    energy = energy_module(plug)
+    if energy is None:
+        raise ApplianceException(f"{plug.host}: no energy meter reading, is this an energy monitoring plug?")
+    return energy.status.power
 
 
-async def notify_finished(appliance: Appliance, notifier_script: str = None, email_context = None, block_window = None) -> None:
-    global pbb
-    logger.custom(f"notify_finished: appliance: {appliance.get_appliance_name()}")
+async def notify_finished(appliance: Appliance, notifier_script: str = None, email_context = None, block_window = None,
+                          push_now: bool = True) -> None:
+    '''
+    Sends the finished notifications for an appliance.
+
+    Args:
+        appliance (Appliance): appliance that finished
+        notifier_script (str): optional notifier script run as a subprocess
+        email_context: optional email settings
+        block_window: optional (start, stop) window in which notifications are suppressed
+        push_now (bool): if False the Pushbullet note is only queued and the caller flushes pbb
+    '''
+    logger.custom("notify_finished: appliance: %s", appliance.get_appliance_name())
+    running_since, appliance.running_since = appliance.running_since, None
+
+    # A re-detected FINISHED shortly after the last one is a duplicate, not a new cycle,
+    # so its short bogus duration must not reach the cycle history either
+    now = monotonic()
+    if appliance.last_notified_at is not None and now - appliance.last_notified_at < NOTIFY_MIN_INTERVAL_SECS:
+        logger.custom("⏸ Duplicate notification suppressed for %s", appliance.get_appliance_name())
+        return
+    appliance.last_notified_at = now
+    if running_since is not None:
+        record_cycle_duration(appliance, now - running_since)
 
     # Suppress notification if within block window
     if block_window and is_within_block(*block_window):
-        logger.custom(f"⏸ Notification suppressed (block window) for {appliance.get_appliance_name()}")
+        logger.custom("⏸ Notification suppressed (block window) for %s", appliance.get_appliance_name())
         return
 
     msg_status: str = " => FINISHED"
     msg_title: str = f"{APP_TAG}: {appliance.get_appliance_name()}"
     msg_string: str = f"{msg_title}{msg_status}"
 
+    channels = {}
     if pbb != None:
-        pbb.send_notification(title=msg_title, message=msg_status)
+        # requests is blocking, keep the HTTPS round trip off the event loop
+        pbb.queue_notification(title=msg_title, message=msg_status)
+        if push_now:
+            channels["pushbullet"] = asyncio.to_thread(pbb.flush)
     if email_context != None:
-        send_text_email(email=email_context.email, app_key=email_context.app_key,
-                        subject=APP_TAG, content=msg_string)
+        # smtplib is blocking too
+        channels["email"] = asyncio.to_thread(send_text_email, email=email_context.email, app_key=email_context.app_key,
+                                              subject=APP_TAG, content=msg_string)
     if notifier_script is not None:
-        if appliance.get_appliance_name() == "dryer":
-            process = await asyncio.create_subprocess_exec("python3", notifier_script, "-d")
-        else:
-            process = await asyncio.create_subprocess_exec("python3", notifier_script)
-        await process.wait()
+        channels["notifier_script"] = spawn_notifier_script(notifier_script, appliance.get_appliance_name())
+    # The channels are independent, one slow or failing channel must not hold up the others
+    results = await asyncio.gather(*channels.values(), return_exceptions=True)
+    for channel, result in zip(channels, results):
+        if isinstance(result, BaseException):
+            logger.error("notify_finished: %s: %s failed", appliance.get_appliance_name(), channel, exc_info=result)
+
+
+async def spawn_notifier_script(notifier_script: str, appliance_name: str) -> None:
+    '''
+    async function.  Starts the user notifier script in the background without
+    waiting for it to exit, so polling keeps its cadence however slow the script is.
+
+    Args:
+        notifier_script (str): script run with python3
+        appliance_name (str): finished appliance, the dryer passes -d to the script
+    '''
+    args = ("python3", notifier_script, "-d") if appliance_name == "dryer" else ("python3", notifier_script)
+    task = asyncio.create_task(run_notifier_script(args))
+    _notifier_tasks.add(task)
+    task.add_done_callback(_notifier_tasks.discard)
+
+
+def notifier_semaphore() -> asyncio.Semaphore:
+    '''
+    Returns the semaphore bounding notifier scripts on the running loop.  It is
+    created on first use, since a semaphore binds to the loop that first waits
+    on it and a later loop (a second Runner, a new test) would otherwise fail.
+    '''
+    global _notifier_semaphore
+    loop = asyncio.get_running_loop()
+    if _notifier_semaphore is None or _notifier_semaphore[0] is not loop:
+        _notifier_semaphore = (loop, asyncio.Semaphore(NOTIFIER_CONCURRENCY_MAX))
+    return _notifier_semaphore[1]
+
 
+async def run_notifier_script(args: tuple[str, ...]) -> None:
+    '''
+    async function.  Runs one notifier script to completion, at most
+    NOTIFIER_CONCURRENCY_MAX at a time, and logs a failed exit.
+
+    Args:
+        args (tuple[str, ...]): command line
+    '''
+    async with notifier_semaphore():
+        try:
+            process = await asyncio.create_subprocess_exec(*args)
+            returncode = await process.wait()
+        except Exception:
+            logger.exception("run_notifier_script: %s", args)
+            return
+    if returncode != 0:
+        logger.error("run_notifier_script: %s exited with %s", args, returncode)
 
 
 def create_config_file(appliances: list[Appliance]) -> None:
-    config = configparser.ConfigParser()
+    config = {appliance.get_appliance_name(): {IDLE_TAG: appliance.get_appliance_idle_power(),
+                                               RUNNING_TAG: appliance.get_appliance_running_power(),
+                                               IP_TAG: appliance.appliance_plug.appliance_plug.host}
+              for appliance in appliances}
+    write_config(config)
+
+
+def write_config(config: dict) -> None:
+    '''
+    Writes CONFIG_FILE in one shot through a temporary file, so a crash while the
+    running service re-pins an ip cannot leave a truncated config behind.
+
+    Args:
+        config (dict): full config to write
+    '''
+    tmp_file = f"{CONFIG_FILE}.tmp"
+    with open(tmp_file, "w") as config_file:
+        config_file.write(json.dumps(config, indent=4))
+    os.replace(tmp_file, CONFIG_FILE)
+
+
+def load_config() -> dict:
+    '''
+    Parses CONFIG_FILE, reusing the previous parse while the file is unchanged so
+    verify_appliances and read_config_file share one read at startup.  Callers must
+    not modify the returned dict.
+
+    Returns:
+        dict: parsed config
+
+    Raises:
+        OSError, ValueError: config file missing or not valid JSON
+    '''
+    stat = os.stat(CONFIG_FILE)
+    key = (CONFIG_FILE, stat.st_mtime_ns, stat.st_size)
+    if key not in _config_cache:
+        with open(CONFIG_FILE) as config_file:
+            config = json.load(config_file)
+        _config_cache.clear()
+        _config_cache[key] = config
+    return _config_cache[key]
+
+
+def read_plug_ips() -> dict[str, str]:
+    '''
+    Reads the plug ips pinned by setup mode.
+
+    Returns:
+        dict[str, str]: plug name to ip, empty if there is no usable config file
+    '''
+    try:
+        config = load_config()
+        return {section_name: section[IP_TAG] for section_name, section in config.items() if IP_TAG in section}
+    except (OSError, ValueError, AttributeError):
+        return {}
+
+
+def update_plug_ips(plug_ips: dict[str, str]) -> None:
+    '''
+    Re-pins plug ips in the config file so the next start connects directly instead
+    of broadcasting.  Only sections setup mode already created are touched.
+
+    Args:
+        plug_ips (dict[str, str]): plug name to the ip it currently answers on
+    '''
+    try:
+        with open(CONFIG_FILE) as config_file:
+            config = json.load(config_file)
+        changed = {name: ip for name, ip in plug_ips.items()
+                   if isinstance(config.get(name), dict) and config[name].get(IP_TAG) != ip}
+        if not changed:
+            return
+        for name, ip in changed.items():
+            config[name][IP_TAG] = ip
+        write_config(config)
+        logger.info("update_plug_ips: %s", changed)
+    except (OSError, ValueError, AttributeError) as e:
+        logger.warning("update_plug_ips: unable to update %s: %s", CONFIG_FILE, e)
+
+
+def read_config_file(appliances: list[Appliance]) -> None:
+    '''
+    Loads idle and running power for each appliance from CONFIG_FILE.
+
+    Args:
+        appliances (list[Appliance]): appliances to configure
+
+    Raises:
+        ApplianceException: config file missing, unreadable or without a section for an appliance
+    '''
+    try:
+        config = load_config()
+    except (OSError, ValueError) as e:
+        # The caller reports this once, a missing config is the usual "run setup first" case
+        raise ApplianceException(f"unable to read {CONFIG_FILE} ({e}), run in setup mode (-s) first") from e
     for appliance in appliances:
         section_name = appliance.get_appliance_name()
-        config.add_section(section_name)
-        config.set(section_name, IDLE_TAG, str(appliance.get_appliance_idle_power()))
-        config.set(section_name, RUNNING_TAG, str(appliance.get_appliance_running_power()))
-    with open(CONFIG_FILE, "w") as config_file:
-        config.write(config_file)
+        try:
+            appliance.set_appliance_idle_power(float(config[section_name][IDLE_TAG]))
+            appliance.set_appliance_running_power(float(config[section_name][RUNNING_TAG]))
+        except (KeyError, TypeError, ValueError) as e:
+            raise ApplianceException(f"no setup data for {section_name} ({e}), run in setup mode (-s) first") from e
 
 
-def read_config_file(appliances: list[Appliance]) -> Union[None, Exception]:
-    config = configparser.ConfigParser()
+def reload_config() -> None:
+    '''
+    SIGHUP handler.  Re-reads CONFIG_FILE into the appliances main_loop is polling so
+    threshold tuning applies without a restart or re-discovery.  A bad edit is logged
+    and the previous thresholds stay in effect for the appliances not yet updated.
+    '''
+    if not _live_appliances:
+        logger.info("reload_config: no running appliances, nothing to reload")
+        return
     try:
-        config.read(CONFIG_FILE)
-        for appliance in appliances:
-            section_name = appliance.get_appliance_name()
-            appliance.set_appliance_idle_power = config[section_name][IDLE_TAG]
-            appliance.set_appliance_running_power = config[section_name][RUNNING_TAG]
-    except Exception as e:
-        msg = f"Exception in read_config_file: {e}"
-        logger.error(msg)
-        raise Exception(msg)
+        read_config_file(_live_appliances)
+        logger.info("reload_config: %r", _live_appliances)
+    except ApplianceException as e:
+        logger.error("reload_config: %s", e)
+
+
+def read_cycle_history(appliances: list[Appliance]) -> None:
+    '''
+    Loads the RUNNING to FINISHED durations recorded by earlier cycles.  A missing
+    or unreadable history just means probing starts at the fixed running cadence.
+
+    Args:
+        appliances (list[Appliance]): appliances to load history into
+    '''
+    try:
+        with open(CYCLE_HISTORY_FILE) as history_file:
+            history = json.load(history_file)
+    except (OSError, ValueError) as e:
+        logger.debug("read_cycle_history: %s", e)
+        return
+    for appliance in appliances:
+        appliance.cycle_durations.extend(float(duration) for duration in history.get(appliance.get_appliance_name(), []))
+
+
+def record_cycle_duration(appliance: Appliance, duration: float) -> None:
+    '''
+    Appends a finished cycle duration to the appliance history and persists it,
+    keeping the last CYCLE_HISTORY_MAX cycles per appliance.
+
+    Args:
+        appliance (Appliance): appliance that just finished
+        duration (float): seconds from RUNNING to FINISHED
+    '''
+    appliance.cycle_durations.append(duration)
+    try:
+        with open(CYCLE_HISTORY_FILE) as history_file:
+            history = json.load(history_file)
+    except (OSError, ValueError):
+        history = {}
+    history[appliance.get_appliance_name()] = list(appliance.cycle_durations)
+    try:
+        with open(CYCLE_HISTORY_FILE, "w") as history_file:
+            history_file.write(json.dumps(history, indent=4))
+    except OSError as e:
+        logger.warning("record_cycle_duration: unable to write %s: %s", CYCLE_HISTORY_FILE, e)
+
+
+async def await_running(appliance: Appliance, timeout: float) -> bool:
+    '''
+    Polls an appliance every SETUP_PROBE_INTERVAL_SECS until its power rises
+    above twice the idle power, returning as soon as it does.
+
+    Args:
+        appliance (Appliance): appliance with idle power already set
+        timeout (float): seconds to give up after, interrupting any pending probe or sleep
+
+    Returns:
+        bool: True if the running power was set
+    '''
+    try:
+        async with asyncio.timeout(timeout):
+            while True:
+                running_power = await appliance.get_power()
+                if running_power > appliance.running_threshold:
+                    appliance.set_appliance_running_power(running_power)
+                    return True
+                await asyncio.sleep(SETUP_PROBE_INTERVAL_SECS)
+    except TimeoutError:
+        return False
 
 
 async def setup_loop(appliances: list[Appliance]) -> bool:
     '''
-    analyze app,iance idle and load power levels and create config file
+    analyze appliance idle and load power levels and create config file.
+    Each appliance waits for its own running power in await_running, so an
+    appliance that has already been detected is not probed again.
 
     Args:
-        appliances (list[Appliance]): _description_
+        appliances (list[Appliance]): appliances to calibrate
 
     Returns:
-        bool: _description_
+        bool: True if the config file was written
     '''
-    idle_power: float
-    running_power: float
-    idle_power_set: bool = True
     # Assume we start in idle mode and user manually turns on appliance(s) after 30s
-    for appliance in appliances:
-        idle_power = await appliance.get_power()
+    idle_powers = await asyncio.gather(*(appliance.get_power() for appliance in appliances))
+    for appliance, idle_power in zip(appliances, idle_powers):
         appliance.set_appliance_idle_power(idle_power)
-        logger.custom(f"We have set the IDLE power: {idle_power} for the appliance: {appliance.get_appliance_name()}")
-    logger.custom(f"We have set the IDLE power for the appliance(s)")
-
-    await asyncio.sleep(RUNNING_TIME_WAIT_SECS)
-
-    running_power_set: bool = True
-    retry_count = 0
-    elapsed_seconds = 0
-    retry_seconds_max = RUNNING_SETUP_RETRY_MAX * RUNNING_TIME_WAIT_SECS
-    while True:
-        for appliance in appliances:
-            if appliance.appliance_running_power <= (2 * appliance.appliance_idle_power):
-                running_power = await appliance.get_power()
-                if running_power <= (2 * appliance.appliance_idle_power):
-                    running_power_set = False
-                else:
-                    appliance.set_appliance_running_power(running_power)
-        if running_power_set:
-            logger.custom("Running power set for appliance(s)")
-            break
-
-        logger.warning(f"Failed to detect RUNNING power, retry {retry_count}")
-        running_power_set = True
-        retry_count += 1
-        await asyncio.sleep(SETUP_PROBE_INTERVAL_SECS)
-        elapsed_seconds += SETUP_PROBE_INTERVAL_SECS
-        if elapsed_seconds > retry_seconds_max:
-            logger.error(f"UNABLE to set running power in one or more appliances")
-            break
-    logger.custom(f"setup_loop: running_power_set: {running_power_set}, retry_count: {retry_count}, elapsed_seconds: {elapsed_seconds}")
-    #  if successful, create a config file
-    if idle_power_set and running_power_set:
-        create_config_file(appliances)
+        logger.custom("We have set the IDLE power: %s for the appliance: %s", idle_power, appliance.get_appliance_name())
+    logger.custom("We have set the IDLE power for the appliance(s)")
+
+    setup_start = monotonic()
+    timeout = RUNNING_TIME_WAIT_SECS + RUNNING_SETUP_RETRY_MAX * RUNNING_TIME_WAIT_SECS
+    running_power_results = await asyncio.gather(*(await_running(appliance, timeout) for appliance in appliances))
+    running_power_set: bool = all(running_power_results)
+    if running_power_set:
+        logger.custom("Running power set for appliance(s)")
     else:
+        logger.error("UNABLE to set running power in one or more appliances")
+    logger.custom("setup_loop: running_power_set: %s, elapsed_seconds: %.0f", running_power_set, monotonic() - setup_start)
+    #  if successful, create a config file
+    if not running_power_set:
         return False
+    create_config_file(appliances)
     return True
 
 
-async def verify_appliances(appliance_plug_infos: list[AppliancePlugInfo]) -> Union[list[Appliance], ApplianceException]:
+async def verify_appliances(appliance_plug_infos: list[AppliancePlugInfo]) -> list[Appliance]:
+    '''
+    async function.  Resolves every requested plug through init_plugs and wraps
+    each one in an Appliance.
+
+    Args:
+        appliance_plug_infos (list[AppliancePlugInfo]): requested plugs
+
+    Returns:
+        list[Appliance]: one Appliance per plug, or empty if any plug was not found
+    '''
+    plug_ips = read_plug_ips()
+    for appliance_plug_info in appliance_plug_infos:
+        if appliance_plug_info.ip is None:
+            appliance_plug_info.ip = plug_ips.get(appliance_plug_info.appliance_plug_name)
     appliance_plugs: list[AppliancePlug] = await init_plugs(appliance_plug_infos)
     if len(appliance_plugs) != len(appliance_plug_infos):
         return []
+    # Before the first setup run there is no config to re-pin, create_config_file writes the ips
+    if os.path.exists(CONFIG_FILE):
+        update_plug_ips({appliance_plug.appliance_plug_info.appliance_plug_name: appliance_plug.appliance_plug.host
+                         for appliance_plug in appliance_plugs
+                         if appliance_plug.appliance_plug.host != plug_ips.get(appliance_plug.appliance_plug_info.appliance_plug_name)})
     appliances: list[Appliance] = []
     for appliance_plug in appliance_plugs:
         appliances.append(Appliance(appliance_plug))
     return appliances
 
 
+def next_probe_interval(appliance_states: list[ApplianceMode], idle_streak: int) -> int:
+    '''
+    Adaptive probe cadence.  Poll quickly while running so a finish is detected
+    promptly, otherwise back off exponentially with the number of consecutive
+    idle polls.
+
+    Args:
+        appliance_states (list[ApplianceMode]): states from the last poll
+        idle_streak (int): consecutive polls that were not running
+
+    Returns:
+        int: seconds to sleep before the next pass
+    '''
+    if ApplianceMode.RUNNING in appliance_states:
+        return RUNNING_PROBE_INTERVAL_SECS
+    return min(IDLE_PROBE_INTERVAL_MAX_SECS, IDLE_PROBE_INTERVAL_SECS * 2 ** min(max(idle_streak - 1, 0), 16))
+
+
+def retry_backoff_delay(consecutive_failures: int) -> float:
+    '''
+    Exponential backoff with jitter for a plug that keeps failing, so a dead plug
+    is probed less and less often and reconnects of several plugs do not line up.
+
+    Args:
+        consecutive_failures (int): failed polls in a row, at least 1
+
+    Returns:
+        float: seconds to wait before polling the plug again
+    '''
+    backoff = min(RETRY_BACKOFF_MAX_SECS, RETRY_BACKOFF_BASE_SECS * 2 ** min(consecutive_failures, 16))
+    return backoff + random.uniform(0, RETRY_JITTER_SECS)
+
+
+def running_probe_interval(elapsed: float, cycle_durations: deque[float]) -> float:
+    '''
+    Probe cadence for a running appliance.  Far from the shortest cycle seen so far
+    the wait is half the remaining time, so polls get denser as the expected finish
+    approaches.  Without enough history this is just RUNNING_PROBE_INTERVAL_SECS.
+
+    Args:
+        elapsed (float): seconds since the appliance started running
+        cycle_durations (deque[float]): past RUNNING to FINISHED durations
+
+    Returns:
+        float: seconds to wait before the next probe
+    '''
+    if len(cycle_durations) < CYCLE_HISTORY_MIN:
+        return RUNNING_PROBE_INTERVAL_SECS
+    remaining = min(cycle_durations) - elapsed
+    return min(RUNNING_PROBE_INTERVAL_MAX_SECS, max(RUNNING_PROBE_INTERVAL_SECS, remaining / 2))
+
+
+def congestion_probe_interval(interval: float, read_secs: float, cap: float) -> float:
+    '''
+    Doubles a probe interval, up to cap, when the last plug read was slow.  A slow
+    reply points at a congested network or a busy plug, so polling it harder only
+    makes things worse.
+
+    Args:
+        interval (float): interval picked from the appliance state
+        read_secs (float): duration of the last plug read
+        cap (float): longest interval allowed for the appliance state
+
+    Returns:
+        float: seconds to wait before the next probe
+    '''
+    if read_secs <= SLOW_READ_SECS:
+        return interval
+    return max(interval, min(2 * interval, cap))
+
+
 async def main_loop(run_mode: RunMode, plug_names: list[AppliancePlugInfo],
                     max_iterations: int = None, notifier_script: str = None,
                     email_context=None, block_window=None) -> bool:
     iterations = 0
     if len(plug_names) == 0:
-        logger.error(f"No washer/dryer specified")
+        logger.error("No washer/dryer specified")
         return False
     appliances = await verify_appliances(plug_names)
     if len(appliances) == 0:
-        logger.error(f"No appliances verified")
+        logger.error("No appliances verified")
         return False
-    logger.info(f"setup_mode: {setup_mode}, appliances: {repr(appliances)}")
+    logger.debug("run_mode: %s, appliances: %r", run_mode, appliances)
     # Handle special run_modes
     if run_mode == RunMode.SETUP:
         return await setup_loop(appliances)
     if run_mode == RunMode.TEST:
-        logger.warning(f"test_mode, sending notification")
-        pbb.send_notification("TEST notification", "FUBAR")
+        logger.warning("test_mode, sending notification")
+        await asyncio.to_thread(pbb.send_notification, "TEST notification", "FUBAR")
         if notifier_script is not None:
             process = await asyncio.create_subprocess_exec("python3", notifier_script)
             await process.wait()
@@ -422,38 +1076,85 @@ async def main_loop(run_mode: RunMode, plug_names: list[AppliancePlugInfo],
 
     try:
         # main running loop forever
+        # Config is read once here, later changes are applied by reload_config on SIGHUP
         read_config_file(appliances)
-        retry_ct = 0
-        error_detected = False
-        while retry_ct < RETRY_MAX:
-            logger.info(f"main_loop: LOOP TOP")
-            # Reset retry_ct if last pass through loop was successful
-            if not error_detected:
-                retry_ct = 0
-            error_detected = False
+        read_cycle_history(appliances)
+        _live_appliances[:] = appliances
+        # Each appliance is polled on its own cadence, see next_probe_interval
+        next_poll_at = {appliance: 0.0 for appliance in appliances}
+        idle_streaks = {appliance: 0 for appliance in appliances}
+        failures = {appliance: 0 for appliance in appliances}
+        while True:
+            logger.debug("main_loop: LOOP TOP")
             # Testability code
             if max_iterations is not None:
                 iterations += 1
                 if iterations >= max_iterations:
                     break
-            try:
-                for appliance in appliances:
-                    appliance_state = await appliance.query()
-                    if appliance_state == ApplianceMode.FINISHED:
-                        await notify_finished(appliance, notifier_script,
-                                              email_context=email_context,
-                                              block_window=block_window)
-                        appliance.set_appliance_mode(ApplianceMode.IDLE)
-            except Exception as e:
-                # Treat this as a network issue, retry after sleep up to RETRY_MAX attempts
-                retry_ct = retry_ct + 1
-                error_detected = True
-                logger.error(f'Unexpected exception in main_loop: {e}, retry_ct: {retry_ct}')
-                await asyncio.sleep(RETRY_SLEEP_DELAY)
-            await asyncio.sleep(PROBE_INTERVAL_SECS)
+            now = monotonic()
+            due_appliances = [appliance for appliance in appliances if next_poll_at[appliance] <= now]
+            # A failing plug must not hide the result of the others
+            results = await asyncio.gather(*(appliance.query() for appliance in due_appliances), return_exceptions=True)
+            # Treat a failed query as a network issue on that plug only, it backs off on its own
+            stale_appliances = []
+            for appliance, result in zip(due_appliances, results):
+                if not isinstance(result, BaseException):
+                    failures[appliance] = 0
+                    continue
+                failures[appliance] += 1
+                logger.error('Unexpected exception in main_loop: %s: %s, failures: %d',
+                             appliance.get_appliance_name(), result, failures[appliance])
+                if failures[appliance] >= REDISCOVER_RETRY_COUNT:
+                    stale_appliances.append(appliance)
+            if stale_appliances:
+                # Repeated failures, the cached device handle may point at a stale ip
+                try:
+                    await refresh_appliance_plugs(stale_appliances)
+                except Exception:
+                    logger.exception('refresh_appliance_plugs failed')
+            finished_appliances = [appliance for appliance, result in zip(due_appliances, results)
+                                   if result == ApplianceMode.FINISHED]
+            notify_results = await asyncio.gather(*(notify_finished(appliance, notifier_script,
+                                                                    email_context=email_context,
+                                                                    block_window=block_window,
+                                                                    push_now=False)
+                                                    for appliance in finished_appliances),
+                                                  return_exceptions=True)
+            if pbb is not None and finished_appliances:
+                # One push for every appliance that finished in this pass
+                try:
+                    await asyncio.to_thread(pbb.flush)
+                except Exception:
+                    logger.exception('Pushbullet flush failed')
+            for appliance, result in zip(finished_appliances, notify_results):
+                if isinstance(result, BaseException):
+                    # A failed notification is not a plug problem, don't count it as a plug failure
+                    logger.error('notify_finished failed for %s', appliance.get_appliance_name(), exc_info=result)
+                appliance.set_appliance_mode(ApplianceMode.IDLE)
+            for appliance, result in zip(due_appliances, results):
+                if failures[appliance]:
+                    next_poll_at[appliance] = monotonic() + retry_backoff_delay(failures[appliance])
+                    continue
+                if result == ApplianceMode.RUNNING:
+                    idle_streaks[appliance] = 0
+                else:
+                    idle_streaks[appliance] += 1
+                # Schedule from the previous slot so query latency does not accumulate as drift,
+                # resyncing to now when the slot has already passed (first poll, retry delay)
+                if result == ApplianceMode.RUNNING and appliance.running_since is not None:
+                    interval = running_probe_interval(monotonic() - appliance.running_since, appliance.cycle_durations)
+                else:
+                    interval = next_probe_interval([result], idle_streaks[appliance])
+                cap = RUNNING_PROBE_INTERVAL_MAX_SECS if result == ApplianceMode.RUNNING else IDLE_PROBE_INTERVAL_MAX_SECS
+                interval = congestion_probe_interval(interval, appliance.appliance_plug.last_read_secs, cap)
+                scheduled = next_poll_at[appliance] + interval
+                next_poll_at[appliance] = scheduled if scheduled > monotonic() else monotonic() + interval
+            await asyncio.sleep(max(0.0, min(next_poll_at.values()) - monotonic()))
         return True
-    except Exception as e:
-        logger.error(f"main_loop Exception: {e}")
+    except ApplianceException as e:
+        logger.error("main_loop: %s", e)
+    except Exception:
+        logger.exception("main_loop Exception")
     return False
 
 
@@ -470,7 +1171,7 @@ def init_argparse() -> argparse.ArgumentParser:
         description='Notify when washer, dryer finishes'
     )
     parser.add_argument('-v', '--version', action='version',
-                        version=f'%(prog)s version 1.0.0')
+                        version='%(prog)s version 1.0.0')
     parser.add_argument('-s', '--setup_mode', action='store_true',
                         help='setup mode, detect voltage levels and create config file')
     parser.add_argument('-t', '--test_mode', action='store_true',
@@ -492,12 +1193,20 @@ def init_argparse() -> argparse.ArgumentParser:
     parser.add_argument('-k', '--app_key', metavar='',
                         help='Google app key for gmail reports')
     parser.add_argument(
-        '-b', '--block_time', nargs=2, metavar=('START', 'STOP'),
+        '-b', '--block_time', nargs=2, metavar=('START', 'STOP'), type=parse_block_time,
         help='time window in 24h HH:MM HH:MM format to suppress notifications'
     )
     return parser
 
-import contextlib
+
+async def watch_stop(stop_event: asyncio.Event, main_task: asyncio.Task) -> None:
+    '''
+    async function.  Cancels main_task once a stop signal has set stop_event.
+    '''
+    await stop_event.wait()
+    logger.info("Cancelling main task...")
+    main_task.cancel()
+
 
 async def async_main(run_mode, plugs, notifier_script, email_context, block_window):
     """Wraps main_loop with graceful signal handling."""
@@ -511,83 +1220,74 @@ async def async_main(run_mode, plugs, notifier_script, email_context, block_wind
     for sig in (signal.SIGINT, signal.SIGTERM):
         with contextlib.suppress(NotImplementedError):
             loop.add_signal_handler(sig, handle_stop_signal)
+    with contextlib.suppress(NotImplementedError, AttributeError):
+        loop.add_signal_handler(signal.SIGHUP, reload_config)
 
-    # Run your main loop in a background task so we can cancel it
-    main_task = asyncio.create_task(
-        main_loop(run_mode=run_mode, plug_names=plugs,
-                  notifier_script=notifier_script,
-                  email_context=email_context,
-                  block_window=block_window)
-    )
+    try:
+        async with asyncio.TaskGroup() as task_group:
+            main_task = task_group.create_task(
+                main_loop(run_mode=run_mode, plug_names=plugs,
+                          notifier_script=notifier_script,
+                          email_context=email_context,
+                          block_window=block_window)
+            )
+            stop_task = task_group.create_task(watch_stop(stop_event, main_task))
+            # main_loop returning on its own must not leave the group waiting for a signal
+            main_task.add_done_callback(lambda _: stop_task.cancel())
+    finally:
+        await drain_notifier_tasks()
+        await close_plugs()
+        logger.info("✅ Shutdown complete.")
+    # A signal stop is a clean exit, otherwise report what main_loop returned
+    return True if main_task.cancelled() else main_task.result()
+
+
+def event_loop_factory():
+    '''
+    Returns uvloop's event loop factory when uvloop is installed, otherwise None
+    so asyncio.Runner falls back to the stock event loop.
+    '''
+    try:
+        import uvloop
+    except ImportError:
+        return None
+    return uvloop.new_event_loop
 
-    # Wait until either the stop signal arrives or main_task finishes
-    done, pending = await asyncio.wait(
-        {main_task, asyncio.create_task(stop_event.wait())},
-        return_when=asyncio.FIRST_COMPLETED
-    )
 
-    if stop_event.is_set():
-        logger.info("Cancelling main task...")
-        main_task.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await main_task
+def main() -> None:
+    global logger, pbb
 
-    logger.info("✅ Shutdown complete.")
-    return True
+    args = init_argparse().parse_args()
 
+    plugs: list[AppliancePlugInfo] = [AppliancePlugInfo(appliance_type, plug_name)
+                                      for appliance_type, plug_name in ((ApplianceType.WASHER, args.washer_plug_name),
+                                                                        (ApplianceType.DRYER, args.dryer_plug_name))
+                                      if plug_name]
+    # -t wins over -s
+    run_mode: RunMode = RunMode.TEST if args.test_mode else RunMode.SETUP if args.setup_mode else RunMode.NORMAL
+    email_context: Optional[EmailContext] = EmailContext(args.email, args.app_key) if args.email and args.app_key else None
+    block_window: Optional[list[time]] = args.block_time or None
 
-def main() -> None:
-    global log_file, logger, setup_mode, access_token, pbb, block_window
-
-    plugs: list[AppliancePlugInfo] = []
-    notifier_script: str = None
-    run_mode: RunMode = RunMode.NORMAL
-    email_context: EmailContext = None
-
-    parser = init_argparse()
-    args = parser.parse_args()
-
-    # logging setup and argument parsing as before...
-    if args.log_file_name != None:
-        log_file = args.log_file_name
-    if args.washer_plug_name:
-        plugs.append(AppliancePlugInfo(ApplianceType.WASHER, args.washer_plug_name))
-    if args.dryer_plug_name:
-        plugs.append(AppliancePlugInfo(ApplianceType.DRYER, args.dryer_plug_name))
-    if args.setup_mode:
-        run_mode = RunMode.SETUP
-    if args.access_token:
-        access_token = args.access_token
-    if args.channel_tag:
-        channel_tag = args.channel_tag
-    else:
-        channel_tag = None
-    if args.notifier_script:
-        notifier_script = args.notifier_script
-    if args.email and args.app_key:
-        email_context = EmailContext(args.email, args.app_key)
-    if args.test_mode:
-        run_mode = RunMode.TEST
-    if args.block_time:
-        block_window = args.block_time
-
-    logger = init_logging(log_file)
-
-    if access_token is None or channel_tag is None:
+    logger = init_logging(args.log_file_name or LOG_FILE)
+    queue_logging_handlers(logger)
+
+    if not (args.access_token and args.channel_tag):
         logger.warning("No access_token/channel_tag, cannot send pushbullet notifications")
     else:
-        logger.info(f"pbb: access_token: {access_token}, channel_tag: {channel_tag}")
-        pbb = PushbulletBroadcaster(access_token, channel_tag)
-    
-    logger.custom(f'>>>>> START washer_plug_name: {plugs}, run_mode: {run_mode}, pushbullet: {pbb}, block_window: {block_window} <<<<<')
+        logger.info("pbb: access_token: %s, channel_tag: %s", args.access_token, args.channel_tag)
+        pbb = PushbulletBroadcaster(args.access_token, args.channel_tag)
+
+    logger.custom('>>>>> START washer_plug_name: %s, run_mode: %s, pushbullet: %s, block_window: %s <<<<<',
+                  plugs, run_mode, pbb, block_window)
 
     try:
-        success = asyncio.run(async_main(run_mode, plugs, notifier_script, email_context, block_window))
-    except Exception as e:
-        logger.error(f"Exception in async_main: {e}")
+        with asyncio.Runner(loop_factory=event_loop_factory()) as runner:
+            success = runner.run(async_main(run_mode, plugs, args.notifier_script or None, email_context, block_window))
+    except Exception:
+        logger.exception("Exception in async_main")
         success = False
 
-    logger.custom(f'>>>>> FINI <<<<< success: {success}')
+    logger.custom('>>>>> FINI <<<<< success: %s', success)
 
 
 if __name__ == '__main__':
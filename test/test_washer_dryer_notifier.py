@@ -1,7 +1,12 @@
 import pytest
 import asyncio
 import responses
+import requests
 import logging
+import json
+import atexit
+import threading
+from collections import deque
 from scripts.washer_dryer_notifier import (
     PushbulletBroadcaster,
     AppliancePlugInfo,
@@ -11,13 +16,11 @@ from scripts.washer_dryer_notifier import (
     ApplianceMode,
     RunMode,
     main_loop,
-    pbb,
 )
-from unittest.mock import MagicMock
+from unittest.mock import Mock
 import scripts.washer_dryer_notifier as notifier
-import pdb
-import os
 import glob
+import os
 from logging.handlers import TimedRotatingFileHandler
 
 
@@ -38,6 +41,27 @@ dummy_logger = logging.getLogger("dummy")
 dummy_logger.addHandler(logging.StreamHandler())
 dummy_logger.setLevel(CUSTOM_LEVEL_NUM)
 
+@pytest.fixture(autouse=True)
+def patch_logger(monkeypatch):
+    # The module logger is only created by main(), give every test the dummy one
+    monkeypatch.setattr(notifier, "logger", dummy_logger)
+
+@pytest.fixture(autouse=True)
+def isolate_data_files(monkeypatch, tmp_path):
+    # Setup mode and cycle tracking write these, keep them away from the sample config in the repo
+    monkeypatch.setattr(notifier, "CONFIG_FILE", str(tmp_path / "washer_dryer_notifier.config"))
+    monkeypatch.setattr(notifier, "CYCLE_HISTORY_FILE", str(tmp_path / "washer_dryer_notifier.history"))
+
+@pytest.fixture(autouse=True)
+def isolate_live_appliances(monkeypatch):
+    # main_loop registers its appliances module wide, don't let them outlive the test
+    monkeypatch.setattr(notifier, "_live_appliances", [])
+
+@pytest.fixture
+def stub_read_config(monkeypatch):
+    # main_loop tests supply their own appliances and need no config file on disk
+    monkeypatch.setattr(notifier, "read_config_file", lambda appliances: None)
+
 # --- No-op sleep to avoid timeouts --- #
 async def no_sleep(duration):
     return None
@@ -47,12 +71,29 @@ class DummyEmeter:
     def __init__(self, power):
         self.power = power
 
+class DummyEnergy:
+    # Stands in for kasa's Module.Energy, both reads report the device's emeter_realtime
+    def __init__(self, device):
+        self.device = device
+
+    @property
+    def status(self):
+        return self.device.emeter_realtime
+
+    async def get_status(self):
+        return self.device.emeter_realtime
+
 class DummySmartDevice:
-    def __init__(self, alias, power=1.0, is_on=True):
+    def __init__(self, alias, power=1.0, is_on=True, host="192.168.1.10"):
         self.alias = alias
+        self.host = host
         self.emeter_realtime = DummyEmeter(power)
         self.is_on = is_on
 
+    @property
+    def modules(self):
+        return {notifier.Module.Energy: DummyEnergy(self)}
+
     async def update(self):
         # Simulate a no-op update
         return
@@ -75,26 +116,41 @@ class DummyApplianceForSetup(Appliance):
     async def query(self) -> ApplianceMode:
         # For this test, query is not used in setup mode
         return self.appliance_mode
+
+@pytest.fixture
+def make_appliance():
+    # Builds a fresh device -> plug info -> plug -> appliance chain, appliances keep per-test state
+    def _make(alias, appliance_type, appliance_class=Appliance, *appliance_args, device=None, **plug_kwargs):
+        plug_info = AppliancePlugInfo(appliance_type=appliance_type, appliance_plug_name=alias)
+        device = device if device is not None else DummySmartDevice(alias=alias, power=1.0, is_on=True)
+        return plug_info, appliance_class(AppliancePlug(plug_info, device, **plug_kwargs), *appliance_args)
+    return _make
+
+@pytest.fixture
+def washer_and_dryer(make_appliance):
+    washer_plug_info, washer_appliance = make_appliance("washer", notifier.ApplianceType.WASHER, DummyApplianceForSetup)
+    dryer_plug_info, dryer_appliance = make_appliance("dryer", notifier.ApplianceType.DRYER, DummyApplianceForSetup)
+    return [washer_plug_info, dryer_plug_info], [washer_appliance, dryer_appliance]
     
 # --- Tests for PushbulletBroadcaster --- #
-@responses.activate
-def test_pushbullet_broadcaster_send_notification(monkeypatch):
-    responses.add(
-        responses.POST,
-        "https://api.pushbullet.com/v2/pushes",
-        json={"success": True},
-        status=200,
-    )
-    # Patch logger to avoid NoneType errors
-    monkeypatch.setattr(notifier, "logger", dummy_logger)
+PUSHES_URL = "https://api.pushbullet.com/v2/pushes"
+
+@pytest.fixture
+def pushbullet_api():
+    # One registration of the pushes endpoint shared by every Pushbullet test
+    with responses.RequestsMock(assert_all_requests_are_fired=False) as api:
+        api.add(responses.POST, PUSHES_URL, json={"success": True}, status=200)
+        yield api
+
+def test_pushbullet_broadcaster_send_notification(pushbullet_api):
     broadcaster = PushbulletBroadcaster(access_token="dummy_token", channel_tag="dummy_channel")
     try:
         broadcaster.send_notification("Test Title", "Test Message")
     except Exception as e:
         pytest.fail(f"send_notification() raised an exception: {e}")
-    assert len(responses.calls) == 1
-    call = responses.calls[0]
-    assert call.request.url == "https://api.pushbullet.com/v2/pushes"
+    assert len(pushbullet_api.calls) == 1
+    call = pushbullet_api.calls[0]
+    assert call.request.url == PUSHES_URL
     assert call.response.status_code == 200
 
 # --- Dummy Appliance for Testing main_loop --- #
@@ -108,82 +164,48 @@ class DummyAppliance(Appliance):
 
 # --- Tests for Main Loop Modes --- #
 @pytest.mark.asyncio
-async def test_main_loop_setup_mode_no_appliances(monkeypatch):
-    # Patch logger to avoid NoneType errors
-    monkeypatch.setattr(notifier, "logger", dummy_logger)
+async def test_main_loop_setup_mode_no_appliances(monkeypatch, stub_read_config, make_appliance):
     # Patch asyncio.sleep with our no_sleep function to avoid delays
     monkeypatch.setattr(asyncio, "sleep", no_sleep)
 
-    dummy_device = DummySmartDevice(alias="DummyPlug", power=1.0, is_on=True)
-    dummy_plug_info = AppliancePlugInfo(appliance_type=notifier.ApplianceType.WASHER, appliance_plug_name="DummyPlug")
-    dummy_appliance_plug = AppliancePlug(dummy_plug_info, dummy_device)
-    dummy_appliance = DummyAppliance(dummy_appliance_plug)
+    _, dummy_appliance = make_appliance("DummyPlug", notifier.ApplianceType.WASHER, DummyAppliance)
 
     async def dummy_verify_appliances(appliance_plug_infos):
         return [dummy_appliance]
     monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
-    monkeypatch.setattr(notifier, "read_config_file", lambda appliances: None)
 
     result = await asyncio.wait_for(main_loop(RunMode.SETUP, []), timeout=10)
     assert result is False
 
 @pytest.mark.asyncio
-async def test_main_loop_setup_mode_with_appliances(monkeypatch):
-    # Patch logger to avoid NoneType errors
-    monkeypatch.setattr(notifier, "logger", dummy_logger)
+async def test_main_loop_setup_mode_with_appliances(monkeypatch, stub_read_config, washer_and_dryer):
     # Patch asyncio.sleep with our no_sleep function to avoid delays
     monkeypatch.setattr(asyncio, "sleep", no_sleep)
 
-    dummy_washer_device = DummySmartDevice(alias="washer", power=1.0, is_on=True)
-    dummy_washer_plug_info = AppliancePlugInfo(appliance_type=notifier.ApplianceType.WASHER, appliance_plug_name="washer")
-    dummy_washer_appliance_plug = AppliancePlug(dummy_washer_plug_info, dummy_washer_device)
-    dummy_washer_appliance = DummyApplianceForSetup(dummy_washer_appliance_plug)
-
-    dummy_dryer_device = DummySmartDevice(alias="dryer", power=1.0, is_on=True)
-    dummy_dryer_plug_info = AppliancePlugInfo(appliance_type=notifier.ApplianceType.DRYER, appliance_plug_name="dryer")
-    dummy_dryer_appliance_plug = AppliancePlug(dummy_dryer_plug_info, dummy_dryer_device)
-    dummy_dryer_appliance = DummyApplianceForSetup(dummy_dryer_appliance_plug)
-
-    appliances: list[DummyAppliance] = [dummy_washer_appliance, dummy_dryer_appliance]
-    appliance_plug_infos = [dummy_washer_plug_info, dummy_dryer_plug_info]
+    appliance_plug_infos, appliances = washer_and_dryer
 
     async def dummy_verify_appliances(appliance_plug_infos):
         return appliances
     monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
-    monkeypatch.setattr(notifier, "read_config_file", lambda appliances: None)
 
     result = await asyncio.wait_for(main_loop(RunMode.SETUP, appliance_plug_infos), timeout=10)
     assert result is True
 
 @pytest.mark.asyncio
-async def test_main_loop_test_mode(monkeypatch):
-    # Patch logger to avoid NoneType errors
-    monkeypatch.setattr(notifier, "logger", dummy_logger)
+async def test_main_loop_test_mode(monkeypatch, stub_read_config, washer_and_dryer):
     # Patch asyncio.sleep with our no_sleep function to avoid delays
     monkeypatch.setattr(asyncio, "sleep", no_sleep)
 
     # Mock PushbulletBroadcaster and set it as the global `pbb`
-    mock_pbb = MagicMock()
+    mock_pbb = Mock(spec=PushbulletBroadcaster)
     monkeypatch.setattr(notifier, "pbb", mock_pbb)
 
-    dummy_washer_device = DummySmartDevice(alias="washer", power=1.0, is_on=True)
-    dummy_washer_plug_info = AppliancePlugInfo(appliance_type=notifier.ApplianceType.WASHER, appliance_plug_name="washer")
-    dummy_washer_appliance_plug = AppliancePlug(dummy_washer_plug_info, dummy_washer_device)
-    dummy_washer_appliance = DummyApplianceForSetup(dummy_washer_appliance_plug)
-
-    dummy_dryer_device = DummySmartDevice(alias="dryer", power=1.0, is_on=True)
-    dummy_dryer_plug_info = AppliancePlugInfo(appliance_type=notifier.ApplianceType.DRYER, appliance_plug_name="dryer")
-    dummy_dryer_appliance_plug = AppliancePlug(dummy_dryer_plug_info, dummy_dryer_device)
-    dummy_dryer_appliance = DummyApplianceForSetup(dummy_dryer_appliance_plug)
-
-    appliances: list[DummyAppliance] = [dummy_washer_appliance, dummy_dryer_appliance]
-    appliance_plug_infos = [dummy_washer_plug_info, dummy_dryer_plug_info]
+    appliance_plug_infos, appliances = washer_and_dryer
 
     async def dummy_verify_appliances(appliance_plug_infos):
         return appliances
 
     monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
-    monkeypatch.setattr(notifier, "read_config_file", lambda appliances: None)
 
     # Run the main loop in TEST mode
     result = await asyncio.wait_for(main_loop(RunMode.TEST, appliance_plug_infos, 10), timeout=10)
@@ -195,80 +217,827 @@ async def test_main_loop_test_mode(monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_main_loop_non_setup_mode_no_appliances(monkeypatch):
-    # Patch logger to avoid NoneType errors
-    monkeypatch.setattr(notifier, "logger", dummy_logger)
-
-    dummy_device = DummySmartDevice(alias="DummyPlug", power=1.0, is_on=True)
-    dummy_plug_info = AppliancePlugInfo(appliance_type=notifier.ApplianceType.DRYER, appliance_plug_name="DummyPlug")
-    dummy_appliance_plug = AppliancePlug(dummy_plug_info, dummy_device)
-    dummy_appliance = DummyAppliance(dummy_appliance_plug)
+async def test_main_loop_non_setup_mode_no_appliances(monkeypatch, stub_read_config, make_appliance):
+    _, dummy_appliance = make_appliance("DummyPlug", notifier.ApplianceType.DRYER, DummyAppliance)
 
     async def dummy_verify_appliances(appliance_plug_infos):
         return [dummy_appliance]
     monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
-    monkeypatch.setattr(notifier, "read_config_file", lambda appliances: None)
 
     result = await asyncio.wait_for(main_loop(RunMode.NORMAL, []), timeout=10)
     assert result is False
 
 @pytest.mark.asyncio
-async def test_main_loop_non_setup_mode_with_appliances(monkeypatch):
-    # Patch logger to avoid NoneType errors
-    monkeypatch.setattr(notifier, "logger", dummy_logger)
+async def test_main_loop_non_setup_mode_with_appliances(monkeypatch, stub_read_config, washer_and_dryer):
     # Patch asyncio.sleep with our no_sleep function to avoid delays
     monkeypatch.setattr(asyncio, "sleep", no_sleep)
 
-    dummy_washer_device = DummySmartDevice(alias="washer", power=1.0, is_on=True)
-    dummy_washer_plug_info = AppliancePlugInfo(appliance_type=notifier.ApplianceType.WASHER, appliance_plug_name="washer")
-    dummy_washer_appliance_plug = AppliancePlug(dummy_washer_plug_info, dummy_washer_device)
-    dummy_washer_appliance = DummyApplianceForSetup(dummy_washer_appliance_plug)
-
-    dummy_dryer_device = DummySmartDevice(alias="dryer", power=1.0, is_on=True)
-    dummy_dryer_plug_info = AppliancePlugInfo(appliance_type=notifier.ApplianceType.DRYER, appliance_plug_name="dryer")
-    dummy_dryer_appliance_plug = AppliancePlug(dummy_dryer_plug_info, dummy_dryer_device)
-    dummy_dryer_appliance = DummyApplianceForSetup(dummy_dryer_appliance_plug)
-
-    appliances: list[DummyAppliance] = [dummy_washer_appliance, dummy_dryer_appliance]
-    appliance_plug_infos = [dummy_washer_plug_info, dummy_dryer_plug_info]
+    appliance_plug_infos, appliances = washer_and_dryer
 
     async def dummy_verify_appliances(appliance_plug_infos):
         return appliances
     
     monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
-    monkeypatch.setattr(notifier, "read_config_file", lambda appliances: None)
 
-    # pdb.set_trace()
     result = await asyncio.wait_for(main_loop(RunMode.NORMAL, appliance_plug_infos, 10), timeout=10)
     assert result is True
 
-def test_setup_logging_handlers_returns_timed_rotating_file_handler(tmp_path):
-    # Create a temporary log file path
-    log_file = str(tmp_path / "test.log")
+@pytest.fixture(scope="session")
+def log_dir(tmp_path_factory):
+    # The logging tests use distinct file names, so one directory serves them all
+    return tmp_path_factory.mktemp("logs")
+
+def test_setup_logging_handlers_returns_timed_rotating_file_handler(log_dir):
+    log_file = str(log_dir / "handlers.log")
     handlers = notifier.setup_logging_handlers(log_file)
-    found = False
-    for handler in handlers:
-        if isinstance(handler, TimedRotatingFileHandler):
-            found = True
-            # Verify that the backupCount is set to 5
-            assert handler.backupCount == 5, "Backup count is not 5"
-    assert found, "TimedRotatingFileHandler not found among logging handlers"
-
-def test_logging_file_rotation(tmp_path):
-    # Use the temporary log file
-    log_file = str(tmp_path / "test.log")
+    try:
+        handler = next((handler for handler in handlers if isinstance(handler, TimedRotatingFileHandler)), None)
+        assert handler is not None, "TimedRotatingFileHandler not found among logging handlers"
+        # Verify that the backupCount is set to 5
+        assert handler.backupCount == 5, "Backup count is not 5"
+    finally:
+        for handler in handlers:
+            handler.close()
+
+def test_logging_file_rotation(log_dir):
+    log_file = str(log_dir / "rotation.log")
     logger_instance = notifier.init_logging(log_file)
-    
-    # Log a couple of messages
-    logger_instance.info("Test log message 1")
-    logger_instance.info("Test log message 2")
-    
-    # Find the TimedRotatingFileHandler and force a rollover
-    for handler in logger_instance.handlers:
-        if isinstance(handler, TimedRotatingFileHandler):
-            # Force the rollover
-            handler.doRollover()
-    
+    try:
+        # Log a couple of messages
+        logger_instance.info("Test log message 1")
+        logger_instance.info("Test log message 2")
+
+        # Find the TimedRotatingFileHandler and force a rollover
+        handler = next((handler for handler in logger_instance.handlers if isinstance(handler, TimedRotatingFileHandler)), None)
+        assert handler is not None, "TimedRotatingFileHandler not found among logging handlers"
+        handler.doRollover()
+    finally:
+        # Release the log file so handlers don't pile up on the shared logger
+        for handler in list(logger_instance.handlers):
+            logger_instance.removeHandler(handler)
+            handler.close()
+
     # Look for backup log files. TimedRotatingFileHandler names them with a suffix.
     backup_files = glob.glob(log_file + ".*")
     assert len(backup_files) > 0, "No backup log files created after rollover"
+
+@pytest.mark.asyncio
+async def test_cached_discover_runs_discovery_once_within_ttl(monkeypatch):
+    calls = []
+
+    async def dummy_discover():
+        calls.append(1)
+        return {"10.0.0.2": DummySmartDevice(alias="washer"), "10.0.0.3": DummySmartDevice(alias="dryer")}
+    monkeypatch.setattr(notifier.Discover, "discover", dummy_discover)
+    monkeypatch.setattr(notifier, "_discover_cache", {})
+
+    first = await notifier.cached_discover()
+    second = await notifier.cached_discover()
+    assert len(calls) == 1
+    assert set(first) == {"washer", "dryer"}
+    assert second is first
+
+@pytest.mark.asyncio
+async def test_init_plugs_turns_on_matched_plugs(monkeypatch):
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+    washer_device = DummySmartDevice(alias="washer", is_on=False)
+    other_device = DummySmartDevice(alias="lamp")
+
+    async def dummy_cached_discover():
+        return {"washer": washer_device, "lamp": other_device}
+    monkeypatch.setattr(notifier, "cached_discover", dummy_cached_discover)
+
+    infos = [AppliancePlugInfo(notifier.ApplianceType.WASHER, "washer"),
+             AppliancePlugInfo(notifier.ApplianceType.DRYER, "dryer")]
+    plugs = await notifier.init_plugs(infos)
+    assert [plug.appliance_plug for plug in plugs] == [washer_device]
+    assert washer_device.is_on
+
+def test_next_probe_interval_is_fast_while_running_and_backs_off_when_idle():
+    assert notifier.next_probe_interval([ApplianceMode.IDLE, ApplianceMode.RUNNING], 0) == notifier.RUNNING_PROBE_INTERVAL_SECS
+    assert notifier.next_probe_interval([ApplianceMode.IDLE], 1) == notifier.IDLE_PROBE_INTERVAL_SECS
+    assert notifier.next_probe_interval([ApplianceMode.IDLE], 2) == 2 * notifier.IDLE_PROBE_INTERVAL_SECS
+    assert notifier.next_probe_interval([ApplianceMode.IDLE], 50) == notifier.IDLE_PROBE_INTERVAL_MAX_SECS
+
+@pytest.mark.asyncio
+async def test_appliance_query_ignores_single_sample_spikes(make_appliance):
+    device = DummySmartDevice(alias="washer", power=1.0)
+    _, appliance = make_appliance("washer", notifier.ApplianceType.WASHER, device=device)
+    appliance.set_appliance_idle_power(1.0)
+
+    modes = []
+    for power in [1.0, 1.0, 50.0, 1.0, 1.0, 50.0, 50.0, 1.0, 1.0, 1.0]:
+        device.emeter_realtime.power = power
+        modes.append(await appliance.query())
+    # FINISHED only once the whole window has dropped back to idle
+    assert modes == [ApplianceMode.IDLE] * 6 + [ApplianceMode.RUNNING] * 3 + [ApplianceMode.FINISHED]
+
+def test_create_config_file_writes_json(monkeypatch, tmp_path, make_appliance):
+    config_file = tmp_path / "washer_dryer_notifier.config"
+    monkeypatch.setattr(notifier, "CONFIG_FILE", str(config_file))
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+    washer.set_appliance_idle_power(1.5)
+    washer.set_appliance_running_power(400.0)
+
+    notifier.create_config_file([washer])
+    assert json.loads(config_file.read_text()) == {"washer": {"idle": 1.5, "running": 400.0, "ip": "192.168.1.10"}}
+    assert [path.name for path in tmp_path.iterdir()] == ["washer_dryer_notifier.config"]
+
+def test_queue_logging_handlers_moves_handlers_to_listener():
+    queued_logger = logging.getLogger("queued")
+    queued_logger.setLevel(logging.INFO)
+    records = []
+    emit_threads = []
+    handler = logging.Handler()
+
+    def recording_emit(record):
+        emit_threads.append(threading.get_ident())
+        records.append(record)
+    handler.emit = recording_emit
+    queued_logger.addHandler(handler)
+
+    listener = notifier.queue_logging_handlers(queued_logger)
+    queued_logger.info("queued %s", "message")
+    listener.stop()
+    atexit.unregister(listener.stop)
+    assert [type(h) for h in queued_logger.handlers] == [notifier.DeferredQueueHandler]
+    assert [record.getMessage() for record in records] == ["queued message"]
+    # Formatting was deferred, the record still carries its arguments
+    assert records[0].args == ("message",)
+    assert emit_threads[0] != threading.get_ident()
+
+def test_deferred_queue_handler_snapshots_mutable_args():
+    handler = notifier.DeferredQueueHandler(None)
+    modes = ["RUNNING"]
+    record = dummy_logger.makeRecord("dummy", logging.INFO, __file__, 0, "appliances: %r", (modes,), None)
+    prepared = handler.prepare(record)
+    # The event loop moves on before the listener thread formats the record
+    modes[0] = "IDLE"
+    assert prepared.getMessage() == "appliances: ['RUNNING']"
+    assert record.args == (modes,)
+    record = dummy_logger.makeRecord("dummy", logging.INFO, __file__, 0, "%s: %s", ("washer", ApplianceMode.IDLE), None)
+    assert handler.prepare(record) is record
+
+def test_next_appliance_mode_transitions():
+    assert notifier.next_appliance_mode(ApplianceMode.IDLE, 2.0, 2.0, 1.5) == ApplianceMode.IDLE
+    assert notifier.next_appliance_mode(ApplianceMode.IDLE, 2.5, 2.0, 1.5) == ApplianceMode.RUNNING
+    assert notifier.next_appliance_mode(ApplianceMode.RUNNING, 1.6, 2.0, 1.5) == ApplianceMode.RUNNING
+    assert notifier.next_appliance_mode(ApplianceMode.RUNNING, 1.2, 2.0, 1.5) == ApplianceMode.FINISHED
+    assert notifier.next_appliance_mode(ApplianceMode.FINISHED, 50.0, 2.0, 1.5) == ApplianceMode.FINISHED
+
+@pytest.mark.asyncio
+async def test_init_plugs_uses_pinned_ip_without_discovery(monkeypatch):
+    washer_device = DummySmartDevice(alias="washer", host="192.168.1.20")
+
+    async def dummy_discover_single(host):
+        assert host == "192.168.1.20"
+        return washer_device
+
+    async def failing_cached_discover():
+        pytest.fail("discovery broadcast should be skipped when every plug is pinned")
+    monkeypatch.setattr(notifier.Discover, "discover_single", dummy_discover_single)
+    monkeypatch.setattr(notifier, "cached_discover", failing_cached_discover)
+
+    plugs = await notifier.init_plugs([AppliancePlugInfo(notifier.ApplianceType.WASHER, "washer", "192.168.1.20")])
+    assert [plug.appliance_plug for plug in plugs] == [washer_device]
+
+@pytest.mark.asyncio
+async def test_init_plugs_shares_one_settle_wait(monkeypatch):
+    sleeps = []
+
+    async def recording_sleep(duration):
+        sleeps.append(duration)
+    monkeypatch.setattr(asyncio, "sleep", recording_sleep)
+    devices = {"washer": DummySmartDevice(alias="washer", is_on=False),
+               "dryer": DummySmartDevice(alias="dryer", is_on=False)}
+
+    async def dummy_cached_discover():
+        return devices
+    monkeypatch.setattr(notifier, "cached_discover", dummy_cached_discover)
+
+    plugs = await notifier.init_plugs([AppliancePlugInfo(notifier.ApplianceType.WASHER, "washer"),
+                                       AppliancePlugInfo(notifier.ApplianceType.DRYER, "dryer")])
+    assert len(plugs) == 2
+    assert sleeps == [notifier.PLUG_SETTLE_TIME_SECS]
+
+@pytest.mark.asyncio
+async def test_main_loop_notifies_finished_appliance_when_other_plug_fails(monkeypatch, stub_read_config, make_appliance):
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+
+    class FailingAppliance(Appliance):
+        async def query(self) -> ApplianceMode:
+            raise OSError("plug unreachable")
+
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, DummyAppliance)
+    _, dryer = make_appliance("dryer", notifier.ApplianceType.DRYER, FailingAppliance)
+
+    async def dummy_verify_appliances(appliance_plug_infos):
+        return [washer, dryer]
+    notified = []
+
+    async def dummy_notify_finished(appliance, *args, **kwargs):
+        notified.append(appliance.get_appliance_name())
+    monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
+    monkeypatch.setattr(notifier, "notify_finished", dummy_notify_finished)
+
+    infos = [washer.appliance_plug.appliance_plug_info, dryer.appliance_plug.appliance_plug_info]
+    result = await asyncio.wait_for(main_loop(RunMode.NORMAL, infos, 2), timeout=10)
+    assert result is True
+    assert notified == ["washer"]
+
+@pytest.mark.asyncio
+async def test_main_loop_polls_idle_appliance_less_often_than_running_one(monkeypatch, stub_read_config, make_appliance):
+    clock = [0.0]
+
+    async def advancing_sleep(duration):
+        clock[0] += duration
+    monkeypatch.setattr(asyncio, "sleep", advancing_sleep)
+    monkeypatch.setattr(notifier, "monotonic", lambda: clock[0])
+
+    class CountingAppliance(Appliance):
+        def __init__(self, plug, mode):
+            super().__init__(plug)
+            self.mode = mode
+            self.queries = 0
+
+        async def query(self) -> ApplianceMode:
+            self.queries += 1
+            return self.mode
+
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, CountingAppliance, ApplianceMode.RUNNING)
+    _, dryer = make_appliance("dryer", notifier.ApplianceType.DRYER, CountingAppliance, ApplianceMode.IDLE)
+
+    async def dummy_verify_appliances(appliance_plug_infos):
+        return [washer, dryer]
+    monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
+
+    infos = [washer.appliance_plug.appliance_plug_info, dryer.appliance_plug.appliance_plug_info]
+    await asyncio.wait_for(main_loop(RunMode.NORMAL, infos, 20), timeout=10)
+    assert washer.queries > 2 * dryer.queries
+
+def test_pushbullet_broadcaster_reuses_session(monkeypatch, pushbullet_api):
+    broadcaster = PushbulletBroadcaster(access_token="dummy_token", channel_tag="dummy_channel")
+    sessions = []
+    original_post = broadcaster.session.post
+
+    def recording_post(*args, **kwargs):
+        sessions.append(broadcaster.session)
+        return original_post(*args, **kwargs)
+    monkeypatch.setattr(broadcaster.session, "post", recording_post)
+
+    broadcaster.send_notification("first", "message")
+    broadcaster.send_notification("second", "message")
+    assert len(pushbullet_api.calls) == 2
+    assert sessions == [broadcaster.session, broadcaster.session]
+
+def test_read_config_file_sets_appliance_powers(monkeypatch, tmp_path, make_appliance):
+    config_file = tmp_path / "washer_dryer_notifier.config"
+    config_file.write_text(json.dumps({"washer": {"idle": 1.5, "running": 400.0, "ip": "192.168.1.10"}}))
+    monkeypatch.setattr(notifier, "CONFIG_FILE", str(config_file))
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+    _, dryer = make_appliance("dryer", notifier.ApplianceType.DRYER)
+
+    notifier.read_config_file([washer])
+    assert washer.get_appliance_idle_power() == 1.5
+    assert washer.get_appliance_running_power() == 400.0
+    assert washer.running_threshold == 3.0
+    with pytest.raises(notifier.ApplianceException, match="setup mode"):
+        notifier.read_config_file([dryer])
+
+@pytest.mark.asyncio
+async def test_refresh_appliance_plugs_swaps_moved_plug(monkeypatch, tmp_path, make_appliance):
+    config_file = tmp_path / "washer_dryer_notifier.config"
+    config_file.write_text(json.dumps({"washer": {"idle": 1.0, "running": 3.0, "ip": "192.168.1.10"}}))
+    monkeypatch.setattr(notifier, "CONFIG_FILE", str(config_file))
+    disconnected = []
+
+    class DisconnectingSmartDevice(DummySmartDevice):
+        async def disconnect(self):
+            disconnected.append(self.host)
+    old_device = DisconnectingSmartDevice(alias="washer", host="192.168.1.10")
+    moved_device = DisconnectingSmartDevice(alias="washer", host="192.168.1.99")
+    monkeypatch.setattr(notifier, "_pinned_devices", [old_device])
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, device=old_device)
+    refreshes = []
+
+    async def dummy_cached_discover(refresh=False):
+        refreshes.append(refresh)
+        return {"washer": moved_device}
+    monkeypatch.setattr(notifier, "cached_discover", dummy_cached_discover)
+
+    await notifier.refresh_appliance_plugs([washer])
+    assert refreshes == [True]
+    assert washer.appliance_plug.appliance_plug is moved_device
+    assert json.loads(config_file.read_text())["washer"]["ip"] == "192.168.1.99"
+    # The replaced handle is closed, not leaked
+    assert disconnected == ["192.168.1.10"]
+    assert notifier._pinned_devices == []
+
+@pytest.mark.asyncio
+async def test_get_power_reuses_fresh_update(monkeypatch, make_appliance):
+    clock = [100.0]
+    monkeypatch.setattr(notifier, "monotonic", lambda: clock[0])
+
+    class CountingSmartDevice(DummySmartDevice):
+        updates = 0
+
+        async def update(self):
+            self.updates += 1
+    device = CountingSmartDevice(alias="washer")
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, device=device, last_update=clock[0],
+                               emeter_reads=notifier.FULL_UPDATE_EVERY_READS)
+
+    await washer.get_power()
+    assert device.updates == 0
+    clock[0] += notifier.UPDATE_FRESH_SECS + 1
+    await washer.get_power()
+    washer.appliance_plug.last_read_secs = notifier.SLOW_READ_SECS + 1
+    await washer.get_power()
+    assert device.updates == 1
+    # The reuse was not a network read, so it must not count as slow
+    assert washer.appliance_plug.last_read_secs == 0.0
+
+@pytest.mark.asyncio
+async def test_get_power_prefers_emeter_only_query(make_appliance):
+    class EmeterSmartDevice(DummySmartDevice):
+        async def update(self):
+            pytest.fail("full update() should not be needed when the emeter can be queried directly")
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, device=EmeterSmartDevice(alias="washer", power=42.0))
+    assert await washer.get_power() == 42.0
+
+@pytest.mark.asyncio
+async def test_get_power_fully_updates_a_swapped_in_device_first(monkeypatch, tmp_path, make_appliance):
+    config_file = tmp_path / "washer_dryer_notifier.config"
+    config_file.write_text(json.dumps({"washer": {"idle": 1.0, "running": 3.0, "ip": "192.168.1.10"}}))
+    monkeypatch.setattr(notifier, "CONFIG_FILE", str(config_file))
+
+    class DiscoveredSmartDevice(DummySmartDevice):
+        # Like kasa, modules raises until the first update()
+        updated = False
+
+        async def update(self):
+            self.updated = True
+
+        @property
+        def modules(self):
+            if not self.updated:
+                raise notifier.KasaException("You need to await update() to access the data")
+            return super().modules
+    moved_device = DiscoveredSmartDevice(alias="washer", power=7.0, host="192.168.1.99")
+
+    async def dummy_cached_discover(refresh=False):
+        return {"washer": moved_device}
+    monkeypatch.setattr(notifier, "cached_discover", dummy_cached_discover)
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+
+    await notifier.refresh_appliance_plugs([washer])
+    assert await washer.get_power() == 7.0
+    assert moved_device.updated
+    assert washer.appliance_plug.emeter_reads == 0
+
+def test_finished_threshold_tolerates_meter_jitter(make_appliance):
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+    washer.set_appliance_idle_power(1.0)
+    assert washer.finished_threshold == 1.5
+    washer.set_appliance_idle_power(0.3)
+    assert washer.finished_threshold == washer.running_threshold
+
+def test_appliance_dataclass_defaults_are_per_instance(make_appliance):
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+    _, dryer = make_appliance("dryer", notifier.ApplianceType.DRYER)
+    washer.power_window.append(5.0)
+    assert not hasattr(washer, "__dict__")
+    assert washer.get_appliance_name() == "washer"
+    assert washer.get_appliance_mode() == ApplianceMode.IDLE
+    assert len(dryer.power_window) == 0
+
+def test_retry_backoff_delay_grows_and_caps(monkeypatch):
+    monkeypatch.setattr(notifier.random, "uniform", lambda a, b: 0.0)
+    assert notifier.retry_backoff_delay(1) < notifier.retry_backoff_delay(3)
+    assert notifier.retry_backoff_delay(50) == notifier.RETRY_BACKOFF_MAX_SECS
+
+@pytest.mark.asyncio
+async def test_main_loop_keeps_running_and_backs_off_failing_plug(monkeypatch, stub_read_config, make_appliance):
+    clock = [0.0]
+
+    async def advancing_sleep(duration):
+        clock[0] += duration
+    monkeypatch.setattr(asyncio, "sleep", advancing_sleep)
+    monkeypatch.setattr(notifier, "monotonic", lambda: clock[0])
+
+    class CountingAppliance(Appliance):
+        def __init__(self, plug, error=None):
+            super().__init__(plug)
+            self.error = error
+            self.queries = 0
+
+        async def query(self) -> ApplianceMode:
+            self.queries += 1
+            if self.error:
+                raise self.error
+            return ApplianceMode.RUNNING
+
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, CountingAppliance)
+    _, dryer = make_appliance("dryer", notifier.ApplianceType.DRYER, CountingAppliance, OSError("plug unreachable"))
+
+    async def dummy_verify_appliances(appliance_plug_infos):
+        return [washer, dryer]
+
+    async def dummy_refresh_appliance_plugs(appliances):
+        pass
+    monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
+    monkeypatch.setattr(notifier, "refresh_appliance_plugs", dummy_refresh_appliance_plugs)
+
+    infos = [washer.appliance_plug.appliance_plug_info, dryer.appliance_plug.appliance_plug_info]
+    result = await asyncio.wait_for(main_loop(RunMode.NORMAL, infos, 40), timeout=10)
+    assert result is True
+    assert washer.queries > 2 * dryer.queries
+    assert dryer.queries > notifier.REDISCOVER_RETRY_COUNT
+
+def test_running_probe_interval_tightens_near_shortest_cycle():
+    history = deque([3600.0, 4000.0, 3800.0])
+    assert notifier.running_probe_interval(0.0, deque([3600.0])) == notifier.RUNNING_PROBE_INTERVAL_SECS
+    assert notifier.running_probe_interval(0.0, history) == notifier.RUNNING_PROBE_INTERVAL_MAX_SECS
+    assert notifier.running_probe_interval(3400.0, history) == 100.0
+    assert notifier.running_probe_interval(3590.0, history) == notifier.RUNNING_PROBE_INTERVAL_SECS
+
+@pytest.mark.asyncio
+async def test_notify_finished_records_cycle_duration(monkeypatch, tmp_path, make_appliance):
+    monkeypatch.setattr(notifier, "pbb", None)
+    history_file = tmp_path / "washer_dryer_notifier.history"
+    monkeypatch.setattr(notifier, "CYCLE_HISTORY_FILE", str(history_file))
+    clock = [100.0]
+    monkeypatch.setattr(notifier, "monotonic", lambda: clock[0])
+    device = DummySmartDevice(alias="washer", power=1.0)
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, device=device)
+    washer.set_appliance_idle_power(1.0)
+
+    device.emeter_realtime.power = 50.0
+    for _ in range(2):
+        clock[0] += 10.0
+        await washer.query()
+    assert washer.running_since == 110.0
+    clock[0] = 1910.0
+    await notify_finished(washer)
+
+    assert json.loads(history_file.read_text()) == {"washer": [1800.0]}
+    _, reloaded = make_appliance("washer", notifier.ApplianceType.WASHER, device=device)
+    notifier.read_cycle_history([reloaded])
+    assert list(reloaded.cycle_durations) == [1800.0]
+
+@pytest.mark.asyncio
+async def test_main_loop_notifies_finished_appliances_concurrently(monkeypatch, stub_read_config, make_appliance):
+    monkeypatch.setattr(asyncio, "sleep", no_sleep)
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, DummyAppliance)
+    _, dryer = make_appliance("dryer", notifier.ApplianceType.DRYER, DummyAppliance)
+    both_started = asyncio.Event()
+    started = []
+
+    async def dummy_verify_appliances(appliance_plug_infos):
+        return [washer, dryer]
+
+    async def dummy_notify_finished(appliance, *args, **kwargs):
+        # Only completes if the other notification is already in flight
+        started.append(appliance.get_appliance_name())
+        if len(started) == 2:
+            both_started.set()
+        await both_started.wait()
+    monkeypatch.setattr(notifier, "verify_appliances", dummy_verify_appliances)
+    monkeypatch.setattr(notifier, "notify_finished", dummy_notify_finished)
+
+    infos = [washer.appliance_plug.appliance_plug_info, dryer.appliance_plug.appliance_plug_info]
+    result = await asyncio.wait_for(main_loop(RunMode.NORMAL, infos, 2), timeout=5)
+    assert result is True
+    assert sorted(started) == ["dryer", "washer"]
+
+def test_post_bullet_sets_timeout():
+    captured = {}
+
+    class RecordingSession:
+        def post(self, url, **kwargs):
+            captured.update(kwargs)
+            return "response"
+
+    assert PushbulletBroadcaster.post_bullet({"type": "note"}, {}, RecordingSession()) == "response"
+    assert captured["timeout"] == notifier.PUSHBULLET_TIMEOUT_SECS
+
+def test_pushbullet_flush_coalesces_queued_notifications(pushbullet_api):
+    broadcaster = PushbulletBroadcaster(access_token="dummy_token", channel_tag="dummy_channel")
+    broadcaster.queue_notification("washer", " => FINISHED")
+    broadcaster.queue_notification("dryer", " => FINISHED")
+
+    broadcaster.flush()
+    assert len(pushbullet_api.calls) == 1
+    body = json.loads(pushbullet_api.calls[0].request.body)
+    assert body["body"] == "washer => FINISHED\ndryer => FINISHED"
+    assert broadcaster.pending == []
+
+def test_pushbullet_flush_drops_pending_notifications_on_failure(pushbullet_api):
+    pushbullet_api.replace(responses.POST, PUSHES_URL, body=requests.ConnectionError("pushbullet unreachable"))
+    broadcaster = PushbulletBroadcaster(access_token="dummy_token", channel_tag="dummy_channel")
+    for index in range(notifier.PUSHBULLET_BATCH_MAX + 2):
+        broadcaster.queue_notification(f"washer {index}", " => FINISHED")
+
+    with pytest.raises(requests.ConnectionError):
+        broadcaster.flush()
+    assert len(pushbullet_api.calls) == 1
+    # Nothing is left to ride along with a later, unrelated notification
+    assert broadcaster.pending == []
+
+@pytest.mark.asyncio
+async def test_get_power_falls_back_to_full_update_periodically(make_appliance):
+    class EmeterSmartDevice(DummySmartDevice):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.updates = 0
+
+        async def update(self):
+            self.updates += 1
+    device = EmeterSmartDevice(alias="washer", power=42.0)
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, device=device)
+
+    for _ in range(notifier.FULL_UPDATE_EVERY_READS + 1):
+        await washer.get_power()
+    assert device.updates == 1
+    assert washer.appliance_plug.emeter_reads == 0
+
+def test_congestion_probe_interval_doubles_after_slow_read():
+    assert notifier.congestion_probe_interval(60, 0.1, 600) == 60
+    assert notifier.congestion_probe_interval(60, notifier.SLOW_READ_SECS + 1, 600) == 120
+    assert notifier.congestion_probe_interval(400, notifier.SLOW_READ_SECS + 1, 600) == 600
+    assert notifier.congestion_probe_interval(600, notifier.SLOW_READ_SECS + 1, 300) == 600
+
+@pytest.mark.asyncio
+async def test_verify_appliances_first_setup_run_logs_no_warning(monkeypatch, caplog):
+    async def dummy_init_plugs(appliance_plug_infos):
+        return [AppliancePlug(info, DummySmartDevice(alias=info.appliance_plug_name)) for info in appliance_plug_infos]
+    monkeypatch.setattr(notifier, "init_plugs", dummy_init_plugs)
+
+    # isolate_data_files points CONFIG_FILE at a file that does not exist yet
+    with caplog.at_level(logging.WARNING, logger=dummy_logger.name):
+        appliances = await notifier.verify_appliances([AppliancePlugInfo(notifier.ApplianceType.WASHER, "washer")])
+    assert [appliance.get_appliance_name() for appliance in appliances] == ["washer"]
+    assert caplog.records == []
+    assert not os.path.exists(notifier.CONFIG_FILE)
+
+def test_update_plug_ips_only_touches_existing_sections(monkeypatch, tmp_path):
+    config_file = tmp_path / "washer_dryer_notifier.config"
+    config_file.write_text(json.dumps({"washer": {"idle": 1.0, "running": 3.0, "ip": "192.168.1.10"}}))
+    monkeypatch.setattr(notifier, "CONFIG_FILE", str(config_file))
+
+    notifier.update_plug_ips({"washer": "192.168.1.20", "dryer": "192.168.1.21"})
+    assert json.loads(config_file.read_text()) == {"washer": {"idle": 1.0, "running": 3.0, "ip": "192.168.1.20"}}
+
+@pytest.mark.asyncio
+async def test_notify_finished_sends_email_off_the_event_loop(monkeypatch, make_appliance):
+    monkeypatch.setattr(notifier, "pbb", None)
+    loop_thread = threading.get_ident()
+    sent = []
+
+    def dummy_send_text_email(**kwargs):
+        sent.append((kwargs["email"], threading.get_ident()))
+    monkeypatch.setattr(notifier, "send_text_email", dummy_send_text_email)
+
+    class EmailContext:
+        email = "user@example.com"
+        app_key = "app_key"
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+    await notify_finished(washer, email_context=EmailContext())
+    assert len(sent) == 1
+    assert sent[0][0] == "user@example.com"
+    assert sent[0][1] != loop_thread
+
+def test_post_bullet_sends_preencoded_json(pushbullet_api):
+    payload = {"type": "note", "title": "washer", "body": "✅ FINISHED"}
+    PushbulletBroadcaster.post_bullet(payload, {"Content-Type": "application/json"})
+    request = pushbullet_api.calls[0].request
+    assert request.headers["Content-Type"] == "application/json"
+    assert json.loads(request.body) == payload
+
+def test_main_maps_arguments_to_async_main(monkeypatch):
+    captured = {}
+
+    async def dummy_async_main(run_mode, plugs, notifier_script, email_context, block_window):
+        captured.update(run_mode=run_mode, plugs=plugs, notifier_script=notifier_script,
+                        email_context=email_context, block_window=block_window)
+        return True
+    monkeypatch.setattr(notifier, "async_main", dummy_async_main)
+    monkeypatch.setattr(notifier, "init_logging", lambda log_file: dummy_logger)
+    monkeypatch.setattr(notifier, "queue_logging_handlers", lambda target_logger: None)
+    monkeypatch.setattr(notifier, "pbb", None)
+    monkeypatch.setattr(notifier, "logger", None)
+    monkeypatch.setattr("sys.argv", ["washer_dryer_notifier.py", "-s", "-t", "-d", "dryer", "-e", "user@example.com"])
+
+    notifier.main()
+    assert captured["run_mode"] == RunMode.TEST
+    assert [info.appliance_plug_name for info in captured["plugs"]] == ["dryer"]
+    assert captured["notifier_script"] is None
+    assert captured["email_context"] is None
+    assert captured["block_window"] is None
+    assert notifier.pbb is None
+
+@pytest.mark.asyncio
+async def test_notify_finished_does_not_wait_for_notifier_script(monkeypatch, make_appliance):
+    monkeypatch.setattr(notifier, "pbb", None)
+    script_done = asyncio.Event()
+    spawned = []
+
+    class DummyProcess:
+        async def wait(self):
+            await script_done.wait()
+            return 0
+
+    async def dummy_create_subprocess_exec(*args):
+        spawned.append(args)
+        return DummyProcess()
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", dummy_create_subprocess_exec)
+    _, dryer = make_appliance("dryer", notifier.ApplianceType.DRYER)
+
+    await asyncio.wait_for(notify_finished(dryer, "notify_wrapper.py"), timeout=5)
+    # Let the background task reach the spawn
+    await asyncio.sleep(0)
+    assert spawned == [("python3", "notify_wrapper.py", "-d")]
+    assert len(notifier._notifier_tasks) == 1
+    script_done.set()
+    await notifier.drain_notifier_tasks(timeout=5)
+    assert len(notifier._notifier_tasks) == 0
+
+def test_run_notifier_script_works_across_event_loops(monkeypatch):
+    class DummyProcess:
+        async def wait(self):
+            await asyncio.sleep(0.01)
+            return 0
+
+    async def dummy_create_subprocess_exec(*args):
+        return DummyProcess()
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", dummy_create_subprocess_exec)
+    monkeypatch.setattr(notifier, "_notifier_semaphore", None)
+
+    async def run_contended():
+        # More scripts than NOTIFIER_CONCURRENCY_MAX, so some wait on the semaphore
+        await asyncio.gather(*(notifier.run_notifier_script(("python3", "notify_wrapper.py"))
+                               for _ in range(notifier.NOTIFIER_CONCURRENCY_MAX + 2)))
+    asyncio.run(run_contended())
+    asyncio.run(run_contended())
+
+def test_is_within_block_handles_overnight_window():
+    start, stop = notifier.parse_block_time("22:00"), notifier.parse_block_time("06:00")
+    assert notifier.is_within_block(start, stop, notifier.parse_block_time("23:30"))
+    assert notifier.is_within_block(start, stop, notifier.parse_block_time("05:59"))
+    assert not notifier.is_within_block(start, stop, notifier.parse_block_time("12:00"))
+    assert not notifier.is_within_block(stop, start, notifier.parse_block_time("23:30"))
+
+def test_parse_block_time_rejects_malformed_time():
+    with pytest.raises(notifier.argparse.ArgumentTypeError):
+        notifier.parse_block_time("25:99")
+
+@pytest.mark.asyncio
+async def test_notify_finished_failing_email_does_not_block_other_channels(monkeypatch, make_appliance):
+    mock_pbb = Mock(spec=PushbulletBroadcaster)
+    monkeypatch.setattr(notifier, "pbb", mock_pbb)
+
+    def failing_send_text_email(**kwargs):
+        raise OSError("smtp unreachable")
+    monkeypatch.setattr(notifier, "send_text_email", failing_send_text_email)
+
+    class EmailContext:
+        email = "user@example.com"
+        app_key = "app_key"
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+    await notify_finished(washer, email_context=EmailContext())
+    mock_pbb.queue_notification.assert_called_once()
+    mock_pbb.flush.assert_called_once()
+
+def test_load_config_reuses_parse_until_file_changes(monkeypatch, tmp_path):
+    config_file = tmp_path / "washer_dryer_notifier.config"
+    config_file.write_text(json.dumps({"washer": {"idle": 1.0, "running": 3.0, "ip": "192.168.1.10"}}))
+    monkeypatch.setattr(notifier, "CONFIG_FILE", str(config_file))
+    loads = []
+    original_load = notifier.json.load
+
+    def counting_load(fp):
+        loads.append(fp.name)
+        return original_load(fp)
+    monkeypatch.setattr(notifier.json, "load", counting_load)
+
+    assert notifier.read_plug_ips() == {"washer": "192.168.1.10"}
+    assert notifier.read_plug_ips() == {"washer": "192.168.1.10"}
+    assert len(loads) == 1
+    config_file.write_text(json.dumps({"washer": {"idle": 1.0, "running": 3.0, "ip": "192.168.1.200"}}))
+    assert notifier.read_plug_ips() == {"washer": "192.168.1.200"}
+    assert len(loads) == 2
+
+@pytest.mark.asyncio
+async def test_await_running_gives_up_after_timeout(monkeypatch, make_appliance):
+    monkeypatch.setattr(notifier, "SETUP_PROBE_INTERVAL_SECS", 0.01)
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+    washer.set_appliance_idle_power(1.0)
+
+    assert await notifier.await_running(washer, 0.05) is False
+    assert washer.get_appliance_running_power() == 0.0
+
+@pytest.mark.asyncio
+async def test_notify_finished_suppresses_duplicates(monkeypatch, tmp_path, make_appliance):
+    mock_pbb = Mock(spec=PushbulletBroadcaster)
+    monkeypatch.setattr(notifier, "pbb", mock_pbb)
+    history_file = tmp_path / "washer_dryer_notifier.history"
+    monkeypatch.setattr(notifier, "CYCLE_HISTORY_FILE", str(history_file))
+    clock = [1000.0]
+    monkeypatch.setattr(notifier, "monotonic", lambda: clock[0])
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER)
+    washer.running_since = clock[0] - 3600
+
+    await notify_finished(washer)
+    history = history_file.read_text()
+    # A flapping plug reports RUNNING then FINISHED again a minute later
+    washer.running_since = clock[0] + 30
+    clock[0] += 60
+    await notify_finished(washer)
+    assert mock_pbb.queue_notification.call_count == 1
+    assert history_file.read_text() == history
+    assert list(washer.cycle_durations) == [3600]
+    assert washer.running_since is None
+    clock[0] += notifier.NOTIFY_MIN_INTERVAL_SECS
+    await notify_finished(washer)
+    assert mock_pbb.queue_notification.call_count == 2
+
+@pytest.mark.asyncio
+async def test_async_main_returns_main_loop_result_and_closes_plugs(monkeypatch):
+    closed = []
+
+    async def failing_main_loop(**kwargs):
+        return False
+
+    async def dummy_close_plugs():
+        closed.append(True)
+    monkeypatch.setattr(notifier, "main_loop", failing_main_loop)
+    monkeypatch.setattr(notifier, "close_plugs", dummy_close_plugs)
+
+    result = await asyncio.wait_for(notifier.async_main(RunMode.NORMAL, [], None, None, None), timeout=5)
+    assert result is False
+    assert closed == [True]
+
+@pytest.mark.asyncio
+async def test_close_plugs_disconnects_pinned_devices(monkeypatch):
+    disconnected = []
+
+    class DisconnectingSmartDevice(DummySmartDevice):
+        async def disconnect(self):
+            disconnected.append(self.alias)
+    monkeypatch.setattr(notifier, "_pinned_devices", [DisconnectingSmartDevice(alias="washer")])
+    monkeypatch.setattr(notifier, "_discover_cache", {"dryer": DisconnectingSmartDevice(alias="dryer")})
+
+    await notifier.close_plugs()
+    assert sorted(disconnected) == ["dryer", "washer"]
+    assert notifier._pinned_devices == []
+
+@pytest.mark.asyncio
+async def test_close_plugs_disconnects_live_handles_after_refresh(monkeypatch, tmp_path, make_appliance):
+    disconnected = []
+
+    class DisconnectingSmartDevice(DummySmartDevice):
+        async def disconnect(self):
+            disconnected.append(self)
+    washer_device = DisconnectingSmartDevice(alias="washer", host="192.168.1.10")
+    dryer_device = DisconnectingSmartDevice(alias="dryer", host="192.168.1.11")
+    moved_dryer_device = DisconnectingSmartDevice(alias="dryer", host="192.168.1.99")
+    discoveries = [{"washer": washer_device, "dryer": dryer_device},
+                   {"washer": DisconnectingSmartDevice(alias="washer", host="192.168.1.10"), "dryer": moved_dryer_device}]
+
+    async def dummy_discover():
+        return discoveries.pop(0)
+    monkeypatch.setattr(notifier.Discover, "discover", dummy_discover)
+    monkeypatch.setattr(notifier, "_discover_cache", {})
+    monkeypatch.setattr(notifier, "_pinned_devices", [])
+    devices = await notifier.cached_discover()
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, device=devices["washer"])
+    _, dryer = make_appliance("dryer", notifier.ApplianceType.DRYER, device=devices["dryer"])
+    notifier._live_appliances[:] = [washer, dryer]
+
+    # Washer is unmoved and keeps its first handle, which the refresh drops from the discovery cache
+    await notifier.refresh_appliance_plugs([washer, dryer])
+    assert washer.appliance_plug.appliance_plug is washer_device
+    await notifier.close_plugs()
+    assert washer_device in disconnected
+    assert dryer_device in disconnected
+    assert moved_dryer_device in disconnected
+    assert notifier._live_appliances == []
+
+def test_reload_config_updates_live_appliance_thresholds(monkeypatch, tmp_path, make_appliance):
+    config_file = tmp_path / "washer_dryer_notifier.config"
+    config_file.write_text(json.dumps({"washer": {"idle": 1.0, "running": 300.0}}))
+    monkeypatch.setattr(notifier, "CONFIG_FILE", str(config_file))
+    _, washer = make_appliance("washer", notifier.ApplianceType.WASHER, Appliance, ApplianceMode.RUNNING)
+    monkeypatch.setattr(notifier, "_live_appliances", [washer])
+
+    notifier.reload_config()
+    assert washer.running_threshold == 2.0
+    config_file.write_text(json.dumps({"washer": {"idle": 4.0, "running": 500.0, "ip": "192.168.1.10"}}))
+    notifier.reload_config()
+    assert washer.running_threshold == 8.0
+    assert washer.get_appliance_running_power() == 500.0
+    assert washer.get_appliance_mode() == ApplianceMode.RUNNING
+    # A broken edit is logged, the last good thresholds stay
+    config_file.write_text("{not json")
+    notifier.reload_config()
+    assert washer.running_threshold == 8.0